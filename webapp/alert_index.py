@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+
+import numpy as np
+import pandas as pd
+import shapely
+
+
+class AlertIndex:
+    '''
+    Spatial (STRtree on bounding boxes of alert AOIs, e.g. alert polygons) and temporal (sorted reference dates)
+    indexes over an AlertDatabase, answering "alerts intersecting this area between these dates" queries without
+    scanning the database. Indexes are built on first query, so that databases which are never queried don't pay
+    for them.
+    '''
+
+    def __init__(self, database, date_column, geometry_column='geometry', chunk_size=100000):
+        self.database = database
+        self.date_column = date_column
+        self.geometry_column = geometry_column
+        # geometries are decoded chunk_size at a time to get their bounds, only bounds are kept
+        self.chunk_size = chunk_size
+        self.lock = threading.Lock()
+        self.tree = None
+
+    def build(self):
+        with self.lock:
+            if self.tree is not None:
+                return
+            self.dates = self.database.column(self.date_column).astype('datetime64[ns]')
+            # stable sort, so that alerts of a same date stay in database order
+            self.date_order = np.argsort(self.dates, kind='stable')
+            self.sorted_dates = self.dates[self.date_order]
+            geometries = self.database.table.column(self.geometry_column)
+            bounds = np.concatenate([shapely.bounds(shapely.from_wkb(geometries.slice(start, self.chunk_size).to_numpy()))
+                                     for start in range(0, len(geometries), self.chunk_size)] or [np.empty((0, 4))])
+            self.tree = shapely.STRtree(shapely.box(*bounds.T))
+
+    def intersecting(self, geometry, positions):
+        '''
+        Takes in an area and positions of alerts whose bounding box intersects it, and returns positions of those
+        whose AOI intersects it. AOIs are only decoded when their bounding box isn't within area.
+        '''
+        shapely.prepare(geometry)
+        uncertain = ~shapely.contains(geometry, self.tree.geometries.take(positions))
+        aois = shapely.from_wkb(self.database.table.column(self.geometry_column).take(positions[uncertain]).to_numpy())
+        keep = np.ones(len(positions), dtype=bool)
+        keep[uncertain] = shapely.intersects(geometry, aois)
+        return positions[keep]
+
+    def query(self, geometry=None, start=None, end=None):
+        '''
+        Takes in an optional area (shapely geometry, in WGS84 degrees) and optional start/end dates (inclusive,
+        numpy datetime64), and returns positions of alerts whose AOI intersects area and with a reference date in
+        range, ordered by reference date then database position.
+        '''
+        if self.tree is None:
+            self.build()
+        start = np.datetime64(start, 'ns') if start is not None else None
+        end = np.datetime64(end, 'ns') if end is not None else None
+        if geometry is None:
+            first = np.searchsorted(self.sorted_dates, start, side='left') if start is not None else 0
+            last = np.searchsorted(self.sorted_dates, end, side='right') if end is not None else len(self.sorted_dates)
+            return self.date_order[first:last]
+
+        positions = self.tree.query(geometry, predicate='intersects')
+        dates = self.dates[positions]
+        in_range = np.ones(len(positions), dtype=bool)
+        if start is not None:
+            in_range &= dates >= start
+        if end is not None:
+            in_range &= dates <= end
+        positions = self.intersecting(geometry, positions[in_range])
+        return positions[np.lexsort((positions, self.dates[positions]))]
+
+
+class IdIndex:
+    '''
+    Maps ids to the position of their first database row. Ids are kept in a pandas Index (hash table over a numpy
+    array of unique ids, along with positions of their first rows) rather than a dict: lookups don't depend on the
+    number of rows, and there are no Python objects per row whose reference counts would make worker processes
+    forked after it was built copy it.
+    '''
+
+    def __init__(self, ids):
+        ids = pd.Index(ids)
+        first_rows = ~ids.duplicated()
+        self.ids = ids[first_rows]
+        self.positions = np.flatnonzero(first_rows)
+        # builds the hash table now rather than on first lookup, e.g. before workers are forked
+        self.ids.get_indexer(self.ids[:1])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get(self, uid, default=None):
+        '''
+        Returns position of the first row of uid, or default if not found.
+        '''
+        try:
+            return int(self.positions[self.ids.get_loc(uid)])
+        except (KeyError, TypeError, OverflowError, pd.errors.InvalidIndexError):
+            return default
+
+    def get_positions(self, uids):
+        '''
+        Bulk version of get: returns an array of positions of the first rows of uids, -1 where not found.
+        '''
+        indexer = self.ids.get_indexer(uids)
+        positions = np.full(len(indexer), -1, dtype=np.int64)
+        found = indexer >= 0
+        positions[found] = self.positions[indexer[found]]
+        return positions
+
+    def __getitem__(self, uid):
+        position = self.get(uid)
+        if position is None:
+            raise KeyError(uid)
+        return position
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Compares precompute_urls.py with and without batching of overlapping rows into shared searches, on synthetic
+alerts of a dense region (Novo Progresso, Para by default) searched on the local fake Planet API.
+
+Run from the webapp folder (same .env and config as the web app):
+    $ python benchmarks/benchmark_batching.py --rows 2000 --latency 0.3 --workers 8
+'''
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import precompute_urls
+import web_app
+from fake_planet_api import FakePlanetAPI
+from generate_alerts import write_alerts
+from planet_client import PlanetClient
+
+
+def run(database, fake_api, workers, batching, workdir):
+    '''
+    Computes URLs of all database rows, and returns (URLs dict, stats dict).
+    '''
+    checkpoint_file = os.path.join(workdir, 'batching_{}.checkpoint.jsonl'.format(batching))
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    searches, page_requests = fake_api.searches, fake_api.page_requests
+    urls = {}
+    start_time = time.perf_counter()
+    failed = precompute_urls.compute_urls(database, urls, checkpoint_file, workers=workers,
+                                          progress_every=len(database), batching=batching)
+    wall_time = time.perf_counter() - start_time
+    return urls, {'seconds': wall_time, 'rows_per_sec': len(database)/wall_time, 'failed': failed,
+                  'upstream_searches': fake_api.searches - searches, 'upstream_pages': fake_api.page_requests - page_requests,
+                  'rows_with_scenes': sum(1 for url in urls.values() if url)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compares URL precomputation with and without batching.')
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--bounds', type=float, nargs=4, default=(-56.0, -8.0, -54.0, -6.0),
+                        metavar=('MIN_LONG', 'MIN_LAT', 'MAX_LONG', 'MAX_LAT'))
+    parser.add_argument('--dates', nargs=2, default=('2020-05-01', '2020-10-31'), metavar=('FIRST', 'LAST'))
+    parser.add_argument('--latency', type=float, default=0.3, help='fake Planet API latency, in seconds')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'planet_hack_benchmarks'))
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    base = os.path.join(args.workdir, 'dense_alerts_{}'.format(args.rows))
+    write_alerts(args.rows, base, bounds=args.bounds, dates=args.dates)
+    # the app loads its own database at import, wait for it before replacing it
+    web_app.wait_until_ready()
+    database = web_app.load_database(base, force_csv=True)
+    web_app.set_database(database)
+    # every search goes upstream
+    web_app.search_cache = None
+    web_app.scene_catalog = None
+
+    fake_api = FakePlanetAPI(latency=args.latency).start()
+    web_app.planet_client = PlanetClient('fake', base_url=fake_api.url, pool_size=args.workers,
+                                         rate_limit=10000, rate_burst=10000)
+    start_time = time.perf_counter()
+    groups = web_app.plan_batches(database)
+    planning_time = time.perf_counter() - start_time
+    _, per_row = run(database, fake_api, args.workers, False, args.workdir)
+    _, batched = run(database, fake_api, args.workers, True, args.workdir)
+    fake_api.stop()
+
+    print(json.dumps({
+        'rows': len(database), 'bounds': args.bounds, 'dates': args.dates, 'upstream_latency': args.latency,
+        'workers': args.workers, 'groups': len(groups), 'planning_seconds': planning_time,
+        'per_row': per_row, 'batched': batched,
+        'speedup': per_row['seconds']/batched['seconds'],
+        'upstream_calls_ratio': (per_row['upstream_searches'] + per_row['upstream_pages'])/(batched['upstream_searches'] + batched['upstream_pages']),
+    }, indent=2))
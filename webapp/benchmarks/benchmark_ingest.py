@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Measures peak memory (max RSS) and duration of database store builds (web_app.ingest_alerts) from synthetic
+alerts (see generate_alerts.py), as a CSV file of points and as a GeoPackage of alert polygons, for several chunk
+sizes. A chunk size of the whole file is how the store used to be built (whole CSV read and built at once).
+
+Each build runs in a new process, peak memory includes the app itself (measured after import, as base_rss_mb).
+Linux only (reads /proc/self/status).
+
+Run from the webapp folder (same .env and config as the web app):
+    $ python benchmarks/benchmark_ingest.py --rows 500000 --chunk-sizes 500000 100000 20000
+'''
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from generate_alerts import write_alerts, write_alert_polygons
+
+webapp_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# peak RSS is read from VmHWM, since ru_maxrss is inherited from the parent process across exec
+ingest_code = '''
+import json, sys
+import web_app
+
+def peak_rss():
+    with open('/proc/self/status') as f:
+        return [int(line.split()[1]) / 1024. for line in f if line.startswith('VmHWM:')][0]
+
+web_app.wait_until_ready()
+base_rss = peak_rss()
+stats = web_app.ingest_alerts(sys.argv[1], sys.argv[2], chunk_size=int(sys.argv[3]))
+stats.update({'base_rss_mb': base_rss, 'peak_rss_mb': peak_rss()})
+print(json.dumps(stats))
+'''
+
+
+def measure_ingest(source, output, chunk_size):
+    '''
+    Builds output.arrow from source in a new process, and returns its ingest stats along with its memory usage.
+    '''
+    if os.path.exists('{}.arrow'.format(output)):
+        os.remove('{}.arrow'.format(output))
+    result = subprocess.run([sys.executable, '-c', ingest_code, source, output, str(chunk_size)], cwd=webapp_dir,
+                            check=True, capture_output=True, text=True).stdout
+    stats = json.loads(result.strip().splitlines()[-1])
+    stats['store_mb'] = os.path.getsize('{}.arrow'.format(output)) / 2.**20
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measures peak memory of database store builds by chunk size.')
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--chunk-sizes', type=int, nargs='+', default=[500000, 100000, 20000])
+    parser.add_argument('--formats', nargs='+', choices=['csv', 'gpkg'], default=['csv', 'gpkg'])
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'planet_hack_benchmarks'))
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    base = os.path.join(args.workdir, 'alerts_{}_{}'.format(args.rows, args.seed))
+    report = {'rows': args.rows, 'results': {}}
+    for source_format in args.formats:
+        source = '{}.{}'.format(base, source_format)
+        if not os.path.exists(source):
+            print('generating {}'.format(source), file=sys.stderr)
+            (write_alerts if source_format == 'csv' else write_alert_polygons)(args.rows, base, args.seed)
+        report['results'][source_format] = []
+        for chunk_size in args.chunk_sizes:
+            print('{}, chunks of {} rows'.format(source_format, chunk_size), file=sys.stderr)
+            stats = measure_ingest(source, os.path.join(args.workdir, 'ingest_{}'.format(source_format)), chunk_size)
+            stats['chunk_size'] = chunk_size
+            report['results'][source_format].append(stats)
+            print(json.dumps(stats), file=sys.stderr)
+    print(json.dumps(report, indent=2))
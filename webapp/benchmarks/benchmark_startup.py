@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Measures web app startup: time from process start to first answer (/health/live), to readiness (/health/ready),
+and to first successful /api/v1/notice response, with the database warmed up in the background or before serving,
+and with its store already built or built from CSV at start. Also measures time to import the app.
+
+Each run starts the app in a new process (with settings overridden by a WEB_APP_SETTINGS file), searching the local
+fake Planet API, with the search cache, scene catalog and redirect table disabled.
+
+Run from the webapp folder (same .env and config as the web app):
+    $ python benchmarks/benchmark_startup.py --rows 100000
+'''
+
+import argparse
+import csv
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_planet_api import FakePlanetAPI
+from generate_alerts import write_alerts
+
+webapp_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def write_settings(workdir, base, background, api_url):
+    '''
+    Writes a WEB_APP_SETTINGS file for a benchmark run, and returns its path.
+    '''
+    settings_file = os.path.join(workdir, 'startup_settings_{}.cfg'.format(background))
+    with open(settings_file, 'w') as f:
+        f.write('\n'.join([
+            'DEBUG_MODE = False',
+            'DATABASE_FILE_BASENAME = {!r}'.format(base),
+            'LOGGING_FILE_NAME = {!r}'.format(os.path.join(workdir, 'startup.log')),
+            'WARMUP_IN_BACKGROUND = {}'.format(background),
+            'PLANET_API_URL = {!r}'.format(api_url),
+            'SEARCH_CACHE_ENABLED = False',
+            'SCENE_CATALOG_ENABLED = False',
+            'REDIRECT_TABLE_ENABLED = False',
+            '',
+        ]))
+    return settings_file
+
+
+def wait_for(url, status=None, timeout=600):
+    '''
+    Polls url until it answers (with status, if given), and returns the response.
+    '''
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            response = requests.get(url, timeout=timeout)
+            if status is None or response.status_code == status:
+                return response
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.01)
+    raise TimeoutError('{} did not answer in {}s'.format(url, timeout))
+
+
+def measure_import(settings_file):
+    '''
+    Returns time to import the app in a new process, in seconds.
+    '''
+    code = 'import time; t = time.perf_counter(); import web_app; print(time.perf_counter() - t)'
+    output = subprocess.run([sys.executable, '-c', code], cwd=webapp_dir, check=True, capture_output=True, text=True,
+                            env=dict(os.environ, WEB_APP_SETTINGS=settings_file)).stdout
+    return float(output.split()[-1])
+
+
+def measure_startup(settings_file, uid):
+    '''
+    Starts the app in a new process, and returns a dict of times (in seconds, from process start) to first answer,
+    readiness and first successful notice, along with the status and latency of the first notice request.
+    '''
+    port = free_port()
+    app_url = 'http://127.0.0.1:{}'.format(port)
+    code = 'import web_app; web_app.app.run(port={}, threaded=True)'.format(port)
+    start_time = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', code], cwd=webapp_dir, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL, env=dict(os.environ, WEB_APP_SETTINGS=settings_file))
+    try:
+        wait_for('{}/health/live'.format(app_url))
+        stats = {'first_answer_seconds': time.perf_counter() - start_time}
+        request_time = time.perf_counter()
+        response = requests.get('{}/api/v1/notice'.format(app_url), params={'id': uid}, timeout=600)
+        stats.update({'first_notice_status': response.status_code,
+                      'first_notice_latency_seconds': time.perf_counter() - request_time})
+        wait_for('{}/health/ready'.format(app_url), status=200)
+        stats['ready_seconds'] = time.perf_counter() - start_time
+        while response.status_code != 200:
+            response = requests.get('{}/api/v1/notice'.format(app_url), params={'id': uid}, timeout=600)
+        stats['first_notice_ok_seconds'] = time.perf_counter() - start_time
+    finally:
+        process.terminate()
+        process.wait()
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measures web app startup and warm-up times.')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--latency', type=float, default=0.0, help='fake Planet API latency, in seconds')
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'planet_hack_benchmarks'))
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    base = os.path.join(args.workdir, 'alerts_{}_{}'.format(args.rows, args.seed))
+    if not os.path.exists('{}.csv'.format(base)):
+        write_alerts(args.rows, base, args.seed)
+    with open('{}.csv'.format(base), newline='') as f:
+        uid = next(csv.DictReader(f))['UNIQUE_ID']
+
+    fake_api = FakePlanetAPI(latency=args.latency).start()
+    report = {'rows': args.rows, 'upstream_latency': args.latency,
+              'import_seconds': measure_import(write_settings(args.workdir, base, True, fake_api.url)),
+              'results': {}}
+    store_file = '{}.arrow'.format(base)
+    # store is built from csv by from_csv runs, then found by built runs
+    for store in ('from_csv', 'built'):
+        for background in (True, False):
+            if store == 'from_csv' and os.path.exists(store_file):
+                os.remove(store_file)
+            name = '{}_{}'.format(store, 'background' if background else 'blocking')
+            print(name, file=sys.stderr)
+            report['results'][name] = measure_startup(write_settings(args.workdir, base, background, fake_api.url), uid)
+            print(json.dumps(report['results'][name]), file=sys.stderr)
+    fake_api.stop()
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Measures memory of web app worker processes serving one synthetic alert database (see generate_alerts.py),
+for several numbers of workers and ways of loading the database:
+- preload: store loaded and indexes built once by the parent, workers forked from it (like gunicorn --preload)
+- independent: each worker imports the app and memory-maps the store itself (like gunicorn without --preload)
+- geodataframe: each worker holds the whole database as a geodataframe (how the app used to load it)
+
+Each worker answers id lookups and alerts queries, then reports its RSS, PSS (shared pages divided between the
+processes sharing them, so that PSS of all processes add up to the memory actually used) and USS (private pages).
+Linux only (reads /proc/self/smaps_rollup).
+
+Run from the webapp folder (same .env and config as the web app):
+    $ python benchmarks/benchmark_workers.py --rows 100000 --workers 1 4 16
+'''
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+
+import numpy as np
+import shapely
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from generate_alerts import write_alerts
+
+modes = ('preload', 'independent', 'geodataframe')
+
+
+def memory_usage():
+    '''
+    Returns RSS, PSS and USS of the current process, in MB.
+    '''
+    values = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) == 3 and fields[2] == 'kB':
+                values[fields[0].rstrip(':')] = int(fields[1]) / 1024.
+    return {'rss': values['Rss'], 'pss': values['Pss'], 'uss': values['Private_Clean'] + values['Private_Dirty']}
+
+
+def serve(mode, base, lookups, queries, seed, barrier, results):
+    '''
+    Worker process: loads database (unless preloaded by the parent), answers requests, then reports its memory
+    usage once all workers answered theirs (so that shared pages are divided between all of them).
+    '''
+    import web_app
+    web_app.wait_until_ready()
+    rng = np.random.default_rng(seed)
+    if mode == 'geodataframe':
+        gdf = web_app.load_database(base).to_geodataframe()
+        id_index = dict(zip(gdf[web_app.ID].tolist(), range(len(gdf))))
+        for uid in rng.choice(gdf[web_app.ID].values, lookups):
+            gdf.iloc[id_index[uid]]
+        for _ in range(queries):
+            min_long, min_lat = rng.uniform(-70, -45), rng.uniform(-15, 0)
+            gdf.cx[min_long:min_long + 0.5, min_lat:min_lat + 0.5]
+    else:
+        if mode == 'independent':
+            web_app.set_database(web_app.load_database(base))
+        snapshot = web_app.db_snapshot
+        for uid in rng.choice(snapshot.database.column(web_app.ID), lookups).tolist():
+            web_app.get_row(uid)
+        for _ in range(queries):
+            min_long, min_lat = rng.uniform(-70, -45), rng.uniform(-15, 0)
+            snapshot.alert_index.query(shapely.box(min_long, min_lat, min_long + 0.5, min_lat + 0.5))
+    barrier.wait()
+    results.put(memory_usage())
+    # stay alive until all workers measured their memory
+    barrier.wait()
+
+
+def run(mode, workers, base, lookups, queries):
+    '''
+    Starts workers processes serving base database in mode, and returns their memory usage statistics.
+    '''
+    if mode == 'preload':
+        import web_app
+        web_app.wait_until_ready()
+        web_app.set_database(web_app.load_database(base))
+        web_app.db_snapshot.alert_index.build()
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(workers + 1)
+    results = context.Queue()
+    processes = [context.Process(target=serve, args=(mode, base, lookups, queries, seed, barrier, results))
+                 for seed in range(workers)]
+    for process in processes:
+        process.start()
+    barrier.wait()
+    usages = [results.get() for _ in processes]
+    parent = memory_usage()
+    barrier.wait()
+    for process in processes:
+        process.join()
+
+    stats = {'workers': workers}
+    for field in ('rss', 'pss', 'uss'):
+        values = [usage[field] for usage in usages]
+        stats['{}_mean_mb'.format(field)] = float(np.mean(values))
+        stats['{}_max_mb'.format(field)] = float(np.max(values))
+    # memory actually used by the workers, plus the parent when it holds the database
+    stats['total_pss_mb'] = float(np.sum([usage['pss'] for usage in usages])) + (parent['pss'] if mode == 'preload' else 0)
+    return stats
+
+
+def run_in_subprocess(mode, workers, base, lookups, queries):
+    '''
+    Runs run() in a new process (so that a preloaded parent doesn't outlive its run), and returns its results.
+    '''
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=run_and_report, args=(mode, workers, base, lookups, queries, results))
+    process.start()
+    stats = results.get()
+    process.join()
+    return stats
+
+
+def run_and_report(mode, workers, base, lookups, queries, results):
+    results.put(run(mode, workers, base, lookups, queries))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measures memory of worker processes sharing one alert database.')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--modes', nargs='+', choices=modes, default=list(modes))
+    parser.add_argument('--lookups', type=int, default=2000, help='id lookups per worker')
+    parser.add_argument('--queries', type=int, default=50, help='alerts queries per worker')
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'planet_hack_benchmarks'))
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    base = os.path.join(args.workdir, 'alerts_{}_{}'.format(args.rows, args.seed))
+    if not os.path.exists('{}.csv'.format(base)):
+        write_alerts(args.rows, base, args.seed)
+
+    report = {'rows': args.rows, 'lookups': args.lookups, 'queries': args.queries, 'results': {}}
+    for mode in args.modes:
+        report['results'][mode] = []
+        for workers in args.workers:
+            print('{} mode, {} workers'.format(mode, workers), file=sys.stderr)
+            report['results'][mode].append(run_in_subprocess(mode, workers, base, args.lookups, args.queries))
+            print(json.dumps(report['results'][mode][-1]), file=sys.stderr)
+    print(json.dumps(report, indent=2))
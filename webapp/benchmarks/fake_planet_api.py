@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Local stand-in for the Planet Data API quick-search endpoint, used by benchmarks and load tests.
+
+Scenes are generated deterministically: each cell of a 0.1 degree grid gets a few PlanetScope-like footprints
+(~24 x 8 km strips) per day, with random cloud cover, and searches return the ones intersecting their geometry.
+Results are paginated like the real API (_page_size param, _links._next), and every response can be delayed
+to simulate upstream latency. Error responses (e.g. 429 or 5xx) can be injected with fail_next.
+'''
+
+import datetime
+import json
+import math
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import shapely
+import shapely.geometry
+
+# PlanetScope scene footprint size, in degrees
+footprint_width = 0.22
+footprint_height = 0.07
+# scenes are generated per cell of a fixed grid and per day, so that overlapping searches get the same scenes
+cell_size = 0.1
+
+
+def parse_iso(iso_date):
+    return datetime.datetime.fromisoformat(iso_date.replace('Z', ''))
+
+
+def generate_scenes(search_request, scenes_per_day=1):
+    '''
+    Takes in a quick-search request, and returns a list of features matching its geometry, date and cloud filters.
+    Each (grid cell, day) gets a deterministic set of scenes, so that results are consistent across searches.
+    '''
+    filters = {f['type']: f['config'] for f in search_request['filter']['config']}
+    area = shapely.geometry.shape(filters['GeometryFilter'])
+    start = parse_iso(filters['DateRangeFilter']['gte'])
+    end = parse_iso(filters['DateRangeFilter']['lte'])
+    max_cloud_cover = filters.get('RangeFilter', {}).get('lte', 1)
+
+    # cells of scenes whose footprint may intersect area
+    min_lng, min_lat, max_lng, max_lat = area.bounds
+    cells = [(x, y)
+             for x in range(math.floor((min_lng - footprint_width/2)/cell_size), math.floor((max_lng + footprint_width/2)/cell_size) + 1)
+             for y in range(math.floor((min_lat - footprint_height/2)/cell_size), math.floor((max_lat + footprint_height/2)/cell_size) + 1)]
+    features = []
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day <= end:
+        for (x, y) in cells:
+            rng = random.Random('{}:{}:{}'.format(x, y, day.date()))
+            for _ in range(rng.randint(0, 2 * scenes_per_day)):
+                acquired = day + datetime.timedelta(seconds=rng.randint(36000, 54000))
+                lng = (x + rng.random()) * cell_size
+                lat = (y + rng.random()) * cell_size
+                cloud_cover = round(rng.random() ** 2, 2)
+                scene_id = '{}_{:04x}'.format(acquired.strftime('%Y%m%d_%H%M%S'), rng.randint(0, 0xffff))
+                footprint = shapely.box(lng - footprint_width/2, lat - footprint_height/2, lng + footprint_width/2, lat + footprint_height/2)
+                if not start <= acquired <= end or cloud_cover > max_cloud_cover or not footprint.intersects(area):
+                    continue
+                features.append({
+                    'type': 'Feature',
+                    'id': scene_id,
+                    'geometry': shapely.geometry.mapping(footprint),
+                    'properties': {'acquired': acquired.isoformat() + 'Z', 'cloud_cover': cloud_cover,
+                                   'item_type': 'PSScene4Band', 'publishing_stage': 'finalized'},
+                })
+        day += datetime.timedelta(days=1)
+    # real API default sort is by publishing date, not acquisition date
+    random.Random(json.dumps(search_request, sort_keys=True)).shuffle(features)
+    return features
+
+
+class FakePlanetAPI:
+    '''
+    Threaded local HTTP server answering quick-search requests (POST /quick-search, GET of _links._next pages).
+    '''
+
+    def __init__(self, latency=0.0, scenes_per_day=1, host='127.0.0.1', port=0):
+        self.latency = latency
+        self.scenes_per_day = scenes_per_day
+        self.searches = 0
+        self.page_requests = 0
+        self.failed_requests = 0
+        # (status, Retry-After header) answered to next requests instead of results, see fail_next
+        self.failures = []
+        self.results = {}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self.make_handler())
+        self.server.daemon_threads = True
+        self.url = 'http://{}:{}'.format(*self.server.server_address)
+
+    def make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, *args):
+                pass
+
+            def send_failure(self):
+                '''
+                Answers the next injected failure, if any, and returns whether it did.
+                '''
+                with api.lock:
+                    if not api.failures:
+                        return False
+                    (status, retry_after) = api.failures.pop(0)
+                    api.failed_requests += 1
+                time.sleep(api.latency)
+                self.send_response(status)
+                if retry_after is not None:
+                    self.send_header('Retry-After', str(retry_after))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return True
+
+            def send_page(self, search_id, page, page_size):
+                features = api.results[search_id]
+                body = {'type': 'FeatureCollection', 'features': features[page * page_size:(page + 1) * page_size], '_links': {}}
+                if (page + 1) * page_size < len(features):
+                    body['_links']['_next'] = '{}/searches/{}/results?_page={}&_page_size={}'.format(api.url, search_id, page + 1, page_size)
+                data = json.dumps(body).encode('utf-8')
+                time.sleep(api.latency)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                search_request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                if self.send_failure():
+                    return
+                if url.path.rstrip('/') != '/quick-search':
+                    self.send_error(404)
+                    return
+                page_size = int(parse_qs(url.query).get('_page_size', ['250'])[0])
+                with api.lock:
+                    api.searches += 1
+                    search_id = str(api.searches)
+                api.results[search_id] = generate_scenes(search_request, api.scenes_per_day)
+                self.send_page(search_id, 0, page_size)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                parts = url.path.strip('/').split('/')
+                query = parse_qs(url.query)
+                if self.send_failure():
+                    return
+                if len(parts) != 3 or parts[0] != 'searches' or parts[1] not in api.results:
+                    self.send_error(404)
+                    return
+                with api.lock:
+                    api.page_requests += 1
+                self.send_page(parts[1], int(query['_page'][0]), int(query['_page_size'][0]))
+
+        return Handler
+
+    def fail_next(self, status, count=1, retry_after=None):
+        '''
+        Makes the next count requests answer status (along with a Retry-After header if given) instead of results.
+        '''
+        with self.lock:
+            self.failures.extend([(status, retry_after)] * count)
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Runs a local fake Planet quick-search API.')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.5, help='delay added to every response, in seconds')
+    parser.add_argument('--scenes-per-day', type=int, default=1)
+    args = parser.parse_args()
+    api = FakePlanetAPI(latency=args.latency, scenes_per_day=args.scenes_per_day, port=args.port)
+    print('Fake Planet API listening on {} (set PLANET_API_URL to it)'.format(api.url))
+    api.server.serve_forever()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Generates synthetic DETER-like alert CSV files (same columns and formats as sample_data.csv), for benchmarks,
+or GeoPackage files of alert polygons (like DETER vector exports: no LAT/LONG columns, SIRGAS 2000 CRS).
+
+Alerts are clustered around deforestation hotspots scattered over the Legal Amazon, with view dates spread
+over a few DETER seasons. Output is deterministic for a given seed.
+    $ python benchmarks/generate_alerts.py --rows 100000 --output /tmp/alerts_100k
+    $ python benchmarks/generate_alerts.py --rows 100000 --output /tmp/alerts_100k --polygons
+'''
+
+import argparse
+import csv
+import os
+
+import numpy as np
+import pandas as pd
+import shapely
+
+# Legal Amazon bounding box (WGS84 degrees)
+legal_amazon_bounds = (-73.0, -18.0, -44.0, 5.0)
+hotspot_count = 60
+hotspot_spread = 0.6        # std dev of alert positions around their hotspot, in degrees (less in small areas)
+polygon_vertices = 24
+polygon_radius = (0.0005, 0.004)   # min, max mean radius of alert polygons, in degrees (about 3 to 200 ha)
+first_date = '2016-08-01'
+last_date = '2020-10-01'
+
+
+def generate_alerts(rows, seed=0, bounds=legal_amazon_bounds, dates=(first_date, last_date),
+                    base_url='http://127.0.0.1:5001/api/v1/notice'):
+    '''
+    Takes in a number of rows, and returns a dataframe of synthetic alerts with UNIQUE_ID, VIEW_DATE, LONG, LAT
+    and URL_NEW columns (all strings, formatted like DETER exports), located in bounds (min long, min lat,
+    max long, max lat) and dated between dates (first, last as YYYY-MM-DD).
+    '''
+    min_long, min_lat, max_long, max_lat = bounds
+    rng = np.random.default_rng(seed)
+    hotspots = np.column_stack([rng.uniform(min_long, max_long, hotspot_count), rng.uniform(min_lat, max_lat, hotspot_count)])
+    # a few hotspots get most alerts, like the deforestation arc
+    weights = rng.pareto(1.5, hotspot_count) + 0.1
+    hotspot_ids = rng.choice(hotspot_count, size=rows, p=weights/weights.sum())
+    spread = min(hotspot_spread, (max_long - min_long)/10, (max_lat - min_lat)/10)
+    longs = np.clip(hotspots[hotspot_ids, 0] + rng.normal(0, spread, rows), min_long, max_long)
+    lats = np.clip(hotspots[hotspot_ids, 1] + rng.normal(0, spread, rows), min_lat, max_lat)
+
+    first_day = np.datetime64(dates[0], 'D')
+    day_count = (np.datetime64(dates[1], 'D') - first_day).astype(int)
+    day_offsets = rng.integers(0, day_count, rows)
+    # only format each distinct day once
+    day_strings = pd.DatetimeIndex(first_day + np.arange(day_count)).strftime('%d/%m/%Y').values
+
+    ids = pd.Series(np.arange(1, rows + 1)).astype(str)
+    return pd.DataFrame({
+        'UNIQUE_ID': ids,
+        'VIEW_DATE': day_strings[day_offsets],
+        'LONG': pd.Series(longs).round(4).astype(str),
+        'LAT': pd.Series(lats).round(4).astype(str),
+        'URL_NEW': base_url + '?id=' + ids,
+    })
+
+
+def write_alerts(rows, output, seed=0, bounds=legal_amazon_bounds, dates=(first_date, last_date)):
+    '''
+    Writes rows synthetic alerts to output.csv (output being a base filename, like DATABASE_FILE_BASENAME).
+    '''
+    generate_alerts(rows, seed, bounds, dates).to_csv('{}.csv'.format(output), index=False, quoting=csv.QUOTE_ALL)
+
+
+def write_alert_polygons(rows, output, seed=0, bounds=legal_amazon_bounds, dates=(first_date, last_date), chunk_size=100000):
+    '''
+    Writes rows synthetic alerts to output.gpkg, as irregular polygons around generate_alerts locations (same ids
+    and dates), in SIRGAS 2000 and without LAT/LONG columns, like DETER exports. Written chunk_size rows at a time.
+    '''
+    import geopandas as gpd
+    df = generate_alerts(rows, seed, bounds, dates)
+    rng = np.random.default_rng(seed)
+    angles = np.sort(rng.uniform(0, 2 * np.pi, (rows, polygon_vertices)), axis=1)
+    radii = rng.uniform(*polygon_radius, (rows, 1)) * rng.uniform(0.6, 1.4, (rows, polygon_vertices))
+    if os.path.exists('{}.gpkg'.format(output)):
+        os.remove('{}.gpkg'.format(output))
+    for start in range(0, rows, chunk_size):
+        chunk = slice(start, start + chunk_size)
+        coords = np.stack([df['LONG'].values[chunk].astype(float)[:, None] + radii[chunk] * np.cos(angles[chunk]),
+                           df['LAT'].values[chunk].astype(float)[:, None] + radii[chunk] * np.sin(angles[chunk])], axis=-1)
+        # close rings
+        coords = np.concatenate([coords, coords[:, :1]], axis=1)
+        attributes = df.iloc[chunk].drop(columns=['LONG', 'LAT']).astype({'UNIQUE_ID': int})
+        gdf = gpd.GeoDataFrame(attributes, geometry=shapely.polygons(coords), crs='epsg:4674')
+        gdf.to_file('{}.gpkg'.format(output), driver='GPKG', mode='a' if start else 'w')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generates a synthetic DETER-like alerts CSV file.')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--output', required=True, help='base filename, .csv is appended')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--bounds', type=float, nargs=4, default=legal_amazon_bounds,
+                        metavar=('MIN_LONG', 'MIN_LAT', 'MAX_LONG', 'MAX_LAT'))
+    parser.add_argument('--dates', nargs=2, default=(first_date, last_date), metavar=('FIRST', 'LAST'))
+    parser.add_argument('--polygons', action='store_true', help='write a GeoPackage of alert polygons rather than a CSV file')
+    args = parser.parse_args()
+    if args.polygons:
+        write_alert_polygons(args.rows, args.output, args.seed, args.bounds, args.dates)
+    else:
+        write_alerts(args.rows, args.output, args.seed, args.bounds, args.dates)
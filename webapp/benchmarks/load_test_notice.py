@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Concurrent load test of /api/v1/notice against a local fake Planet API, reporting tail latencies.
+
+Run from the webapp folder (same .env and config as the web app):
+    $ python benchmarks/load_test_notice.py --requests 200 --concurrency 50 --latency 0.5 --distinct-ids 1
+    $ python benchmarks/load_test_notice.py --requests 200 --concurrency 50 --latency 0.5 --distinct-ids 1 --no-coalescing
+
+The search cache, scene catalog and redirect table are disabled unless --with-cache is set, so that every request needs an upstream search
+(or shares a concurrent one).
+'''
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import requests
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import web_app
+from fake_planet_api import FakePlanetAPI
+from planet_client import PlanetClient
+
+
+def percentiles(latencies):
+    latencies = np.asarray(latencies)
+    return {'p50': float(np.percentile(latencies, 50)), 'p95': float(np.percentile(latencies, 95)),
+            'p99': float(np.percentile(latencies, 99)), 'max': float(latencies.max())}
+
+
+def run_load_test(app_url, uids, request_count, concurrency):
+    '''
+    Sends request_count GET /api/v1/notice requests (cycling through uids) with concurrency requests in flight,
+    returns (latencies in seconds, number of failed requests, wall time).
+    '''
+    def timed_request(i):
+        start_time = time.perf_counter()
+        response = requests.get('{}/api/v1/notice'.format(app_url), params={'id': uids[i % len(uids)]}, timeout=120)
+        return time.perf_counter() - start_time, response.status_code == 200 and b'Error' not in response.content
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed_request, range(request_count)))
+    wall_time = time.perf_counter() - start_time
+    return [latency for (latency, _) in results], sum(1 for (_, ok) in results if not ok), wall_time
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Concurrent load test of /api/v1/notice against a fake Planet API.')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.5, help='fake Planet API latency, in seconds')
+    parser.add_argument('--distinct-ids', type=int, default=1, help='number of different alerts requested')
+    parser.add_argument('--no-coalescing', action='store_true', help='disable coalescing of identical searches')
+    parser.add_argument('--with-cache', action='store_true', help='keep the quick-search results cache, scene catalog and redirect table enabled')
+    args = parser.parse_args()
+
+    fake_api = FakePlanetAPI(latency=args.latency).start()
+    web_app.planet_client = PlanetClient('fake', base_url=fake_api.url, pool_size=args.concurrency,
+                                         rate_limit=10000, rate_burst=10000)
+    if not args.with_cache:
+        web_app.search_cache = None
+        web_app.scene_catalog = None
+        web_app.redirect_table = None
+    if args.no_coalescing:
+        web_app.search_flight = None
+    # measure the app, not the debug toolbar rendering nor request logging
+    web_app.app.debug = False
+    web_app.app.config['DEBUG_TB_HOSTS'] = ('toolbar-disabled-during-load-test',)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    server = make_server('127.0.0.1', 0, web_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    app_url = 'http://127.0.0.1:{}'.format(server.server_port)
+
+    web_app.wait_until_ready()
+    uids = web_app.db_snapshot.database.column(web_app.ID)[:args.distinct_ids].tolist()
+    latencies, failed, wall_time = run_load_test(app_url, uids, args.requests, args.concurrency)
+    server.shutdown()
+    fake_api.stop()
+
+    report = dict(percentiles(latencies),
+                  requests=args.requests, concurrency=args.concurrency, distinct_ids=len(uids),
+                  upstream_latency=args.latency, coalescing=not args.no_coalescing,
+                  failed=failed, throughput=args.requests/wall_time, upstream_searches=fake_api.searches,
+                  coalesced=web_app.search_flight.coalesced if web_app.search_flight else 0)
+    print(json.dumps(report, indent=2))
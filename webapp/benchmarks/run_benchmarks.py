@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Benchmark suite of the database build/load and request handling paths, on synthetic DETER-like alerts
+(see generate_alerts.py) and a local fake Planet API (see fake_planet_api.py).
+
+Run from the webapp folder (same .env and config as the web app):
+    $ python benchmarks/run_benchmarks.py --sizes 10000 100000 1000000 --output benchmarks/results/baseline.json
+    $ python benchmarks/run_benchmarks.py --sizes 10000 100000 --compare benchmarks/results/baseline.json
+
+Results are written as JSON (one entry per database size and benchmark). With --compare, durations are compared
+to a previous results file, and the script exits with status 1 if any of them got slower by more than --threshold.
+'''
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import flask
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import web_app
+from fake_planet_api import FakePlanetAPI, generate_scenes
+from generate_alerts import write_alerts
+from planet_client import PlanetClient
+
+# lower is better for these result fields, they are the ones compared with --compare
+compared_fields = ('seconds', 'mean', 'p50', 'p95', 'p99')
+
+
+def summarize(durations):
+    '''
+    Takes in a list of durations (in seconds), and returns their statistics as a dict.
+    '''
+    durations = np.asarray(durations)
+    return {'count': len(durations), 'mean': float(durations.mean()), 'min': float(durations.min()),
+            'p50': float(np.percentile(durations, 50)), 'p95': float(np.percentile(durations, 95)),
+            'p99': float(np.percentile(durations, 99)), 'ops_per_sec': float(len(durations)/durations.sum())}
+
+
+def timed(function, *args, **kwargs):
+    '''
+    Calls function, and returns a (duration in seconds, result) tuple.
+    '''
+    start_time = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start_time, result
+
+
+class InProcessPlanetClient:
+    '''
+    Stand-in for PlanetClient returning generate_scenes() results as pages, without any HTTP call.
+    Scenes are generated on the first search of a request then reused, so that timed searches only
+    measure get_image_ids work.
+    '''
+
+    def __init__(self, scenes_per_day):
+        self.scenes_per_day = scenes_per_day
+        self.scenes = {}
+
+    def quick_search_pages(self, search_request, page_size=250):
+        key = json.dumps(search_request, sort_keys=True)
+        if key not in self.scenes:
+            self.scenes[key] = generate_scenes(search_request, self.scenes_per_day)
+        features = self.scenes[key]
+        for start in range(0, max(len(features), 1), page_size):
+            yield features[start:start + page_size]
+
+
+def bench_load_csv(base):
+    '''
+    Builds the database store from base.csv (removing any existing store first).
+    '''
+    if os.path.exists('{}.arrow'.format(base)):
+        os.remove('{}.arrow'.format(base))
+    duration, rows = timed(web_app.load_csv, base)
+    return {'rows': rows, 'seconds': duration, 'rows_per_sec': rows/duration}
+
+
+def bench_load_database_cold(base):
+    '''
+    Opens the database store (and builds its id index) in a new process, like an app start.
+    '''
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--cold-open', base],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def cold_open(base):
+    web_app.wait_until_ready()
+    duration, database = timed(web_app.load_database, base)
+    index_duration, _ = timed(web_app.set_database, database)
+    return {'seconds': duration + index_duration, 'open_seconds': duration, 'index_seconds': index_duration}
+
+
+def bench_load_database_warm(base, repeat=5):
+    '''
+    Opens the database store repeatedly in this process (file in page cache), building its id index each time.
+    '''
+    durations = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        web_app.set_database(web_app.load_database(base))
+        durations.append(time.perf_counter() - start_time)
+    return summarize(durations)
+
+
+def bench_id_lookup(uids):
+    '''
+    Resolves uids to database rows, one at a time (as done by /api/v1/notice).
+    '''
+    return summarize([timed(web_app.get_row, uid)[0] for uid in uids])
+
+
+def bench_get_image_ids(uids, scenes_per_day):
+    '''
+    Runs get_image_ids (request building, result pages filtering and sorting) on rows of uids,
+    scenes being served from memory.
+    '''
+    planet_client = web_app.planet_client
+    web_app.planet_client = InProcessPlanetClient(scenes_per_day)
+    try:
+        searches = []
+        for uid in uids:
+            row = web_app.get_row(uid)
+            searches.append((web_app.get_search_coord_list(row['geometry']), row['UNIX_TIMES'][2], row['UNIX_TIMES'][3]))
+        # first pass generates scenes
+        for search in searches:
+            web_app.get_image_ids(*search)
+        durations = []
+        image_counts = []
+        for search in searches:
+            duration, image_ids = timed(web_app.get_image_ids, *search)
+            durations.append(duration)
+            image_counts.append(len(image_ids))
+        scene_counts = [len(features) for features in web_app.planet_client.scenes.values()]
+    finally:
+        web_app.planet_client = planet_client
+    return dict(summarize(durations), mean_scenes=float(np.mean(scene_counts)), mean_image_ids=float(np.mean(image_counts)))
+
+
+def bench_end_to_end(uids, latency, scenes_per_day):
+    '''
+    Sends /api/v1/notice requests for uids (sequentially, through the Flask test client), searches being
+    sent to a local fake Planet API with latency seconds of delay.
+    '''
+    fake_api = FakePlanetAPI(latency=latency, scenes_per_day=scenes_per_day).start()
+    planet_client = web_app.planet_client
+    web_app.planet_client = PlanetClient('fake', base_url=fake_api.url, rate_limit=10000, rate_burst=10000)
+    try:
+        client = web_app.app.test_client()
+        durations = []
+        failed = 0
+        for uid in uids:
+            duration, response = timed(client.get, '/api/v1/notice', query_string={'id': uid})
+            durations.append(duration)
+            failed += response.status_code != 200 or b'Error' in response.data
+    finally:
+        web_app.planet_client = planet_client
+        fake_api.stop()
+    return dict(summarize(durations), failed=int(failed), upstream_latency=latency)
+
+
+def run_benchmarks(sizes, workdir, lookups, searches, requests, latency, scenes_per_day, seed=0):
+    '''
+    Runs all benchmarks for each database size, and returns results as a dict.
+    '''
+    # the app loads its own database at import, wait for it before replacing it
+    web_app.wait_until_ready()
+    # measure the app, not the debug toolbar nor the caches, scene catalog and redirect table (log file is kept, console logging is not)
+    web_app.app.logger.removeHandler(flask.logging.default_handler)
+    web_app.app.debug = False
+    web_app.app.config['DEBUG_TB_HOSTS'] = ('toolbar-disabled-during-benchmarks',)
+    web_app.search_cache = None
+    web_app.scene_catalog = None
+    web_app.redirect_table = None
+    web_app.search_flight = None
+
+    rng = np.random.default_rng(seed)
+    results = {}
+    for rows in sizes:
+        base = os.path.join(workdir, 'alerts_{}_{}'.format(rows, seed))
+        if not os.path.exists('{}.csv'.format(base)):
+            write_alerts(rows, base, seed)
+        print('{} rows: load_csv'.format(rows), file=sys.stderr)
+        results[str(rows)] = size_results = {'load_csv': bench_load_csv(base)}
+        print('{} rows: load_database'.format(rows), file=sys.stderr)
+        size_results['load_database_cold'] = bench_load_database_cold(base)
+        size_results['load_database_warm'] = bench_load_database_warm(base)
+        all_uids = web_app.db_snapshot.database.column(web_app.ID)
+        print('{} rows: requests'.format(rows), file=sys.stderr)
+        size_results['id_lookup'] = bench_id_lookup(rng.choice(all_uids, lookups).tolist())
+        size_results['get_image_ids'] = bench_get_image_ids(rng.choice(all_uids, searches).tolist(), scenes_per_day)
+        size_results['end_to_end'] = bench_end_to_end(rng.choice(all_uids, requests).tolist(), latency, scenes_per_day)
+    return results
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(results, baseline, threshold):
+    '''
+    Takes in results and baseline results dicts, prints durations ratios, and returns the list of
+    (size, benchmark, field, ratio) regressions above threshold.
+    '''
+    regressions = []
+    for (size, size_results) in results.items():
+        for (benchmark, values) in size_results.items():
+            baseline_values = baseline.get(size, {}).get(benchmark, {})
+            for field in compared_fields:
+                if field in values and baseline_values.get(field):
+                    ratio = values[field]/baseline_values[field]
+                    regressed = ratio > 1 + threshold
+                    print('{:>8} {:<20} {:<8} {:>10.6f}s -> {:>10.6f}s  x{:.2f}{}'.format(
+                        size, benchmark, field, baseline_values[field], values[field], ratio, '  REGRESSION' if regressed else ''))
+                    if regressed:
+                        regressions.append((size, benchmark, field, ratio))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs benchmarks on synthetic alert databases.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000], help='database sizes, in rows')
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'planet_hack_benchmarks'),
+                        help='where synthetic CSV files and stores are written (CSV files are reused across runs)')
+    parser.add_argument('--lookups', type=int, default=10000, help='id lookups per size')
+    parser.add_argument('--searches', type=int, default=200, help='get_image_ids calls per size')
+    parser.add_argument('--requests', type=int, default=100, help='end to end requests per size')
+    parser.add_argument('--latency', type=float, default=0.0, help='fake Planet API latency for end to end requests, in seconds')
+    parser.add_argument('--scenes-per-day', type=int, default=1, help='average scenes per day and 0.1 degree cell')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON results file')
+    parser.add_argument('--compare', help='JSON results file to compare results with')
+    parser.add_argument('--threshold', type=float, default=0.2, help='max accepted slowdown ratio with --compare')
+    parser.add_argument('--cold-open', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold_open:
+        print(json.dumps(cold_open(args.cold_open)))
+        sys.exit(0)
+
+    os.makedirs(args.workdir, exist_ok=True)
+    report = {
+        'meta': {
+            'date': datetime.datetime.utcnow().isoformat()+'Z',
+            'git_commit': get_git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'processor': platform.processor() or platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'parameters': {key: value for (key, value) in vars(args).items() if key not in ('output', 'compare', 'threshold', 'cold_open', 'workdir')},
+        },
+        'results': run_benchmarks(args.sizes, args.workdir, args.lookups, args.searches, args.requests,
+                                  args.latency, args.scenes_per_day, args.seed),
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare_results(report['results'], json.load(baseline_file)['results'], args.threshold)
+        if regressions:
+            print('{} regressions above {:.0%}'.format(len(regressions), args.threshold))
+            sys.exit(1)
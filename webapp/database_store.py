@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import shapely
+
+# bump when the layout of the store file changes, older files are then rebuilt from CSV
+STORE_VERSION = 2
+
+# UNIX_TIMES tuples are stored as 4 separate columns
+unix_times_columns = ['UNIX_TIMES_BEFORE', 'UNIX_TIMES_AFTER', 'UNIX_TIMES_ISO_BEFORE', 'UNIX_TIMES_ISO_AFTER']
+
+
+def file_id(path):
+    '''
+    Returns a (device, inode) tuple identifying the file at path, which changes when the file is replaced.
+    '''
+    stat = os.stat(path)
+    return (stat.st_dev, stat.st_ino)
+
+
+def temporary_path(path):
+    '''
+    Returns a path next to path to write it to before renaming it, unique to the calling process and thread so that
+    concurrent writers of the same store (e.g. worker processes rebuilding it) never write to the same file.
+    '''
+    return '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+
+
+class DatabaseStoreError(Exception):
+    '''
+    Raised when a store file can't be used (missing, other store version or built with other parameters).
+    '''
+    pass
+
+
+class AlertDatabase:
+    '''
+    Read-only alert database backed by an Arrow table (usually memory-mapped from a store file).
+    Attribute columns are used in place, geometries are only decoded from WKB when rows are accessed.
+    '''
+
+    def __init__(self, table, path=None, file_id=None):
+        self.table = table
+        # store file the table is memory-mapped from, if any, and its file_id when opened
+        self.path = path
+        self.file_id = file_id
+        self.columns = json.loads(table.schema.metadata[b'columns'])
+        self.crs = table.schema.metadata[b'crs'].decode('utf-8') or None
+
+    @classmethod
+    def from_geodataframe(cls, gdf, build_params=None, row_hashes=None):
+        '''
+        Takes in a geodataframe built by load_csv (and optionally hashes of source csv rows, used for
+        incremental rebuilds), and returns it as an in-memory AlertDatabase.
+        '''
+        df = pd.DataFrame(gdf.drop(columns=['UNIX_TIMES', 'geometry']))
+        for (i, name) in enumerate(unix_times_columns):
+            df[name] = [unix_times[i] for unix_times in gdf['UNIX_TIMES']]
+        df['geometry'] = shapely.to_wkb(gdf.geometry.values)
+        if row_hashes is not None:
+            df['ROW_HASH'] = np.asarray(row_hashes, dtype=np.uint64)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = {
+            'store_version': str(STORE_VERSION),
+            'build_params': json.dumps(build_params or {}, sort_keys=True),
+            'columns': json.dumps(list(gdf.columns)),
+            'crs': gdf.crs.to_string() if gdf.crs else '',
+        }
+        return cls(table.replace_schema_metadata(metadata))
+
+    @classmethod
+    def open(cls, path, build_params=None):
+        '''
+        Memory-maps store file at path, and returns it as an AlertDatabase.
+        Raises DatabaseStoreError if file is missing, or has been built by another store version or other parameters.
+        '''
+        if not os.path.exists(path):
+            raise DatabaseStoreError('{} not found'.format(path))
+        opened_file_id = file_id(path)
+        table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        metadata = table.schema.metadata or {}
+        store_version = metadata.get(b'store_version', b'').decode('utf-8')
+        if store_version != str(STORE_VERSION):
+            raise DatabaseStoreError('{} has store version {!r}, expected {}'.format(path, store_version, STORE_VERSION))
+        if json.loads(metadata[b'build_params']) != json.loads(json.dumps(build_params or {}, sort_keys=True)):
+            raise DatabaseStoreError('{} was built with other parameters'.format(path))
+        return cls(table, path, opened_file_id)
+
+    def save(self, path):
+        '''
+        Writes database to an (uncompressed, so that it can be memory-mapped) Arrow IPC file at path.
+        File is written next to path then renamed, so that readers never see a partially written file.
+        '''
+        tmp_path = temporary_path(path)
+        try:
+            with pa.OSFile(tmp_path, 'wb') as sink:
+                with pa.ipc.new_file(sink, self.table.schema) as writer:
+                    writer.write_table(self.table)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, path)
+
+    @property
+    def has_row_hashes(self):
+        return 'ROW_HASH' in self.table.column_names
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def column(self, name):
+        '''
+        Returns values of an attribute column as a numpy array (without copy for numeric columns).
+        '''
+        return self.table.column(name).to_numpy()
+
+    def row(self, pos):
+        '''
+        Returns row at position pos as a pandas Series, with same values as a load_csv geodataframe row.
+        '''
+        values = {}
+        for name in self.columns:
+            if name == 'UNIX_TIMES':
+                values[name] = tuple(self.table.column(column)[pos].as_py() for column in unix_times_columns)
+            elif name == 'geometry':
+                values[name] = shapely.from_wkb(self.table.column('geometry')[pos].as_py())
+            else:
+                value = self.table.column(name)[pos]
+                values[name] = pd.Timestamp(value.as_py()) if pa.types.is_timestamp(value.type) else value.as_py()
+        return pd.Series(values, name=pos, dtype=object)
+
+    def take(self, positions):
+        '''
+        Returns rows at positions as a geodataframe, with same columns as a load_csv geodataframe.
+        '''
+        return self.to_geodataframe(self.table.take(pa.array(positions, type=pa.int64())))
+
+    def to_geodataframe(self, table=None):
+        '''
+        Returns (whole, or table subset of) database as a geodataframe, decoding all geometries.
+        '''
+        # imported on first use, to keep app startup fast
+        import geopandas as gpd
+        table = self.table if table is None else table
+        df = table.drop_columns(unix_times_columns + ['geometry']).to_pandas()
+        df['UNIX_TIMES'] = list(zip(*[table.column(column).to_pylist() for column in unix_times_columns]))
+        geometry = gpd.GeoSeries.from_wkb(table.column('geometry').to_numpy(zero_copy_only=False), crs=self.crs)
+        return gpd.GeoDataFrame(df, geometry=geometry)[self.columns]
+
+
+class StoreWriter:
+    '''
+    Writes a store file one chunk (in-memory AlertDatabase built with the same columns and parameters) at a time,
+    so that the whole database never has to be held in memory. Used as a context manager: like AlertDatabase.save,
+    file is written next to path, then renamed once all chunks are written (or removed on error).
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = None
+        self.schema = None
+        self.sink = None
+        self.writer = None
+        self.rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.writer is not None:
+            self.writer.close()
+            self.sink.close()
+        if exc_type is not None:
+            if self.tmp_path and os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+            return False
+        if self.writer is None:
+            raise DatabaseStoreError('No rows written to {}'.format(self.path))
+        os.replace(self.tmp_path, self.path)
+        return False
+
+    def write(self, database):
+        '''
+        Appends rows of database to the store file. Its table schema (column types and metadata) must match the
+        first chunk one, column types inferred differently (e.g. a column with missing values in this chunk only)
+        being cast to first chunk ones when possible.
+        '''
+        table = database.table
+        if self.writer is None:
+            self.schema = table.schema
+            self.tmp_path = temporary_path(self.path)
+            self.sink = pa.OSFile(self.tmp_path, 'wb')
+            self.writer = pa.ipc.new_file(self.sink, self.schema)
+        elif not table.schema.equals(self.schema, check_metadata=True):
+            try:
+                table = table.select(self.schema.names).cast(self.schema)
+            except (KeyError, pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+                raise DatabaseStoreError('Rows {}+ don\'t match the types of previous rows ({}), try a larger chunk size'.format(self.rows, e))
+        self.writer.write_table(table)
+        self.rows += table.num_rows
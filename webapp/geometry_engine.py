@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import shapely
+
+# WGS84 ellipsoid
+semi_major_axis = 6378137.0
+eccentricity_squared = 6.69437999014e-3
+
+# same number of segments per quarter circle as shapely's default buffer
+quad_segs = 16
+
+
+def meters_per_degree(lats):
+    '''
+    Takes in latitudes (in degrees), and returns (meters per degree of latitude, meters per degree of longitude)
+    arrays, from WGS84 ellipsoid meridional and normal radii of curvature at these latitudes.
+    '''
+    phi = np.radians(np.asarray(lats, dtype=float))
+    w = 1 - eccentricity_squared * np.sin(phi) ** 2
+    meridional_radius = semi_major_axis * (1 - eccentricity_squared) / w ** 1.5
+    normal_radius = semi_major_axis / np.sqrt(w)
+    # keep a tiny longitude scale at the poles rather than dividing by zero
+    return np.radians(meridional_radius), np.radians(normal_radius * np.maximum(np.cos(phi), 1e-12))
+
+
+def metric_buffers(lngs, lats, radius, shape='circle'):
+    '''
+    Takes in point coordinates (WGS84 degrees) and a radius in meters (scalar or array), and returns a shapely
+    geometry array of 'circle' or 'square' AOIs with true metric dimensions, expressed in WGS84 degrees.
+    Circles are built in the local tangent plane of each point: radius is converted to degrees separately
+    along latitude and longitude, so that AOIs don't get stretched away from the equator.
+    '''
+    lngs = np.asarray(lngs, dtype=float)
+    lats = np.asarray(lats, dtype=float)
+    lat_scale, lng_scale = meters_per_degree(lats)
+    radius_lat = np.broadcast_to(radius / lat_scale, lats.shape)
+    radius_lng = np.broadcast_to(radius / lng_scale, lats.shape)
+    if shape == 'circle':
+        # start east of the point then go clockwise, like shapely's buffer
+        angles = -np.linspace(0, 2 * np.pi, 4 * quad_segs + 1)
+        angles[-1] = 0
+        coords = np.stack([lngs[:, None] + radius_lng[:, None] * np.cos(angles),
+                           lats[:, None] + radius_lat[:, None] * np.sin(angles)], axis=-1)
+        return shapely.polygons(coords)
+    elif shape == 'square':
+        return shapely.box(lngs - radius_lng, lats - radius_lat, lngs + radius_lng, lats + radius_lat)
+    else:
+        raise ValueError('Invalid {} shape value'.format(shape))
+
+
+def metric_buffer(lng, lat, radius, shape='circle'):
+    '''
+    Single point version of metric_buffers, returns a shapely geometry.
+    '''
+    return metric_buffers([lng], [lat], radius, shape)[0]
@@ -1,58 +1,324 @@
-import pickle
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Incremental sync of the alerts review Google Sheet into the web app input CSV, and write-back of computed
+Planet Explorer URLs to the sheet.
+
+Usage (from the webapp folder):
+    $ python gsheet_loader.py sync --mirror sample_data.csv --rebuild-url http://localhost:5000/rebuild
+    $ python gsheet_loader.py write-urls --mirror sample_data.csv --urls sample_data_urls.csv --url-column J
+
+sync only reads the sheet when its revision changed since last sync, and only rewrites the mirror when rows were
+added, edited or removed. With a key column (e.g. --key-column K, a column which changes on every edit of its row,
+such as an edit stamp set by an onEdit Apps Script trigger), the first column and key column are read first, then only
+rows whose values of these columns changed. Without it, all rows are read (in a single batchGet call).
+The mirror CSV is the web app input, and its /rebuild only rebuilds the rows which changed.
+'''
+
+import argparse
+import csv
+import hashlib
+import json
 import os.path
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+import pickle
+
 import pandas as pd
+import requests
+# Google API client modules are imported on first use, so that SheetSync can be used with other services (e.g. in tests)
 
 # https://developers.google.com/sheets/api/samples/reading
 # https://www.googleapis.com/auth/spreadsheets.readonly
 # https://towardsdatascience.com/how-to-import-google-sheets-data-into-a-pandas-dataframe-using-googles-api-v4-2020-f50e84ea4530
 
+# drive metadata scope is used to read the spreadsheet revision
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive.metadata.readonly']
+SPREADSHEET_ID = '1jsiXkTBoz0iJN6sZUSBcPvZqLbYjPDIYKvr2dUBDBBY'
+SHEET_NAME = '10_15_7months_final'
+RANGE_NAME = '{}!A:I'.format(SHEET_NAME)
+
 
 def gsheet_api_check(SCOPES):
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.auth.transport.requests import Request
     creds = None
     if os.path.exists('token.pickle'):
         with open('token.pickle', 'rb') as token:
-            creds = pickle.load(token)    
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    'gsheets_secret_creds.json', SCOPES)
-                creds = flow.run_local_server(port=0)        
-            
-            with open('token.pickle', 'wb') as token:
-                pickle.dump(creds, token)    
-    
-    return creds
+            creds = pickle.load(token)
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            creds.refresh(Request())
+        else:
+            flow = InstalledAppFlow.from_client_secrets_file(
+                'gsheets_secret_creds.json', SCOPES)
+            creds = flow.run_local_server(port=0)
 
+        with open('token.pickle', 'wb') as token:
+            pickle.dump(creds, token)
+
+    return creds
 
 
 def pull_sheet_data(SCOPES,SPREADSHEET_ID,RANGE_NAME):
+    '''
+    Takes in scopes, spreadsheet id and range, and returns the range values as a list of rows (header row first),
+    or None if the range is empty.
+    '''
+    from googleapiclient.discovery import build
     creds = gsheet_api_check(SCOPES)
     service = build('sheets', 'v4', credentials=creds)
-    sheet = service.spreadsheets()
-    result = sheet.values().get(
+    result = service.spreadsheets().values().get(
         spreadsheetId=SPREADSHEET_ID,
         range=RANGE_NAME).execute()
-    values = result.get('values', [])
-    
-    if not values:
-        print('No data found.')
-    else:
-        rows = sheet.values().get(spreadsheetId=SPREADSHEET_ID,
-                                  range=RANGE_NAME).execute()
-        data = rows.get('values')
-        print("COMPLETE: Data copied")
-        return data
+    return result.get('values') or None
 
 
-SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
-SPREADSHEET_ID = '1jsiXkTBoz0iJN6sZUSBcPvZqLbYjPDIYKvr2dUBDBBY'
-RANGE_NAME = '10_15_7months_final!A:I'
+def group_ranges(positions):
+    '''
+    Takes in a sorted list of row positions, and returns the list of (first, last) positions of consecutive ones.
+    '''
+    ranges = []
+    for position in positions:
+        if ranges and ranges[-1][1] == position - 1:
+            ranges[-1] = (ranges[-1][0], position)
+        else:
+            ranges.append((position, position))
+    return ranges
+
+
+class SheetSync:
+    '''
+    Sync of a sheet (columns first_column to last_column, header on first row) into a local CSV mirror. With a
+    key_column, which changes whenever its row is edited, only rows whose first column or key column values changed
+    since last sync are read (see read_changed_rows).
+    Sync state (spreadsheet revision and first column/key column values of rows at last sync, hashes of URLs written
+    back) is kept in a JSON file next to the mirror.
+    '''
+
+    def __init__(self, sheets_service, drive_service, spreadsheet_id, sheet_name, mirror_file, state_file=None,
+                 first_column='A', last_column='I', key_column=None, max_ranges_per_call=500):
+        self.values = sheets_service.spreadsheets().values()
+        self.drive_service = drive_service
+        self.spreadsheet_id = spreadsheet_id
+        self.sheet_name = sheet_name
+        self.mirror_file = mirror_file
+        self.state_file = state_file or '{}.sync.json'.format(mirror_file)
+        self.first_column = first_column
+        self.last_column = last_column
+        self.key_column = key_column
+        self.max_ranges_per_call = max_ranges_per_call
+        self.state = {'revision': None, 'keys': None, 'written_urls': {}}
+        if os.path.exists(self.state_file):
+            with open(self.state_file) as f:
+                self.state.update(json.load(f))
+        # number of rows at last sync, kept by older versions
+        self.state.pop('rows', None)
+
+    def range(self, first_row, last_row=''):
+        return '{}!{}{}:{}{}'.format(self.sheet_name, self.first_column, first_row, self.last_column, last_row)
+
+    def column_range(self, column):
+        return '{}!{}2:{}'.format(self.sheet_name, column, column)
 
-data = pull_sheet_data(SCOPES,SPREADSHEET_ID,RANGE_NAME)
-df = pd.DataFrame(data[1:], columns=data[0])
-print(df)
\ No newline at end of file
+    def batch_get(self, ranges):
+        '''
+        Reads ranges in a single batchGet call, and returns their lists of rows.
+        '''
+        response = self.values.batchGet(spreadsheetId=self.spreadsheet_id, ranges=ranges, majorDimension='ROWS',
+                                        valueRenderOption='UNFORMATTED_VALUE',
+                                        dateTimeRenderOption='FORMATTED_STRING').execute()
+        return [value_range.get('values', []) for value_range in response['valueRanges']]
+
+    def get_revision(self):
+        '''
+        Returns current revision (version number) of the spreadsheet file.
+        '''
+        return self.drive_service.files().get(fileId=self.spreadsheet_id, fields='version').execute()['version']
+
+    def read_mirror(self):
+        if not os.path.exists(self.mirror_file):
+            return []
+        with open(self.mirror_file, newline='') as f:
+            return list(csv.reader(f))
+
+    def write_mirror(self, rows):
+        # written to a temporary file first, so that the web app never reads a partially written mirror
+        with open('{}.tmp'.format(self.mirror_file), 'w', newline='') as f:
+            csv.writer(f).writerows(rows)
+        os.replace('{}.tmp'.format(self.mirror_file), self.mirror_file)
+
+    def save_state(self):
+        with open('{}.tmp'.format(self.state_file), 'w') as f:
+            json.dump(self.state, f)
+        os.replace('{}.tmp'.format(self.state_file), self.state_file)
+
+    def normalize(self, rows, width):
+        # trailing empty cells are omitted by the API, all values are compared and written as strings
+        return [[str(value) for value in row] + [''] * (width - len(row)) for row in rows]
+
+    def sync(self, full=False):
+        '''
+        Pulls the sheet into the mirror if the spreadsheet changed since last sync (or if full, in which case all rows
+        are read), and returns a dict of sync results: revision, rows, rows_read, new_rows, changed_rows and
+        removed_rows.
+        '''
+        revision = self.get_revision()
+        mirror = self.read_mirror()
+        if not full and mirror and revision == self.state['revision']:
+            return {'revision': revision, 'rows': len(mirror) - 1, 'rows_read': 0, 'new_rows': 0, 'changed_rows': 0,
+                    'removed_rows': 0}
+        return self.pull(revision, mirror, full)
+
+    def read_all_rows(self):
+        '''
+        Reads header, all rows and key column (if any) in a single batchGet call, and returns a
+        (header, rows, keys, rows_read) tuple (see read_changed_rows).
+        '''
+        ranges = [self.range(1, 1), self.range(2)] + ([self.column_range(self.key_column)] if self.key_column else [])
+        value_ranges = self.batch_get(ranges)
+        header = [str(value) for value in (value_ranges[0] or [[]])[0]]
+        rows = self.normalize(value_ranges[1], len(header))
+        keys = None
+        if self.key_column:
+            key_values = self.normalize(value_ranges[2], 1)
+            key_values += [['']] * (len(rows) - len(key_values))
+            keys = [[row[0] if row else '', key[0]] for (row, key) in zip(rows, key_values)]
+        return header, rows, keys, len(rows)
+
+    def read_changed_rows(self, mirror):
+        '''
+        Reads header, first column and key column in a first batchGet call, then rows whose first column or key
+        column values differ from last sync (or whose key is empty) in batchGet calls of max_ranges_per_call ranges
+        of consecutive rows, other rows being taken from the mirror. Returns a (header, rows, keys, rows_read) tuple,
+        keys being [first column, key column] values of each row, and rows None if the header changed.
+        '''
+        (header_values, first_values, key_values) = self.batch_get(
+            [self.range(1, 1), self.column_range(self.first_column), self.column_range(self.key_column)])
+        header = [str(value) for value in (header_values or [[]])[0]]
+        if header != mirror[0]:
+            return header, None, None, 0
+        row_count = max(len(first_values), len(key_values))
+        first_values = self.normalize(first_values, 1) + [['']] * (row_count - len(first_values))
+        key_values = self.normalize(key_values, 1) + [['']] * (row_count - len(key_values))
+        keys = [[first[0], key[0]] for (first, key) in zip(first_values, key_values)]
+
+        # the first column tells rows moved by insertions or deletions, the key column edited rows
+        old_keys = self.state['keys']
+        changed_positions = [position for position in range(row_count)
+                             if position >= len(old_keys) or keys[position] != old_keys[position] or not keys[position][1]]
+        rows = [list(row) for row in mirror[1:row_count + 1]]
+        rows += [None] * (row_count - len(rows))
+        ranges = group_ranges(changed_positions)
+        for start in range(0, len(ranges), self.max_ranges_per_call):
+            batch = ranges[start:start + self.max_ranges_per_call]
+            for ((first, last), values) in zip(batch, self.batch_get([self.range(first + 2, last + 2) for (first, last) in batch])):
+                # blank rows are omitted at the end of ranges
+                values = self.normalize(values, len(header))
+                rows[first:last + 1] = values + [[''] * len(header)] * (last + 1 - first - len(values))
+        return header, rows, keys, len(changed_positions)
+
+    def pull(self, revision, mirror, full=False):
+        '''
+        Reads the sheet (changed rows only with a key column, see read_changed_rows), writes it to the mirror if rows
+        were added, edited or removed, and returns sync results (see sync).
+        '''
+        rows = None
+        # keys of last sync describe the mirror rows, unless the mirror was edited or kept from a sync without keys
+        if self.key_column and not full and mirror and self.state['keys'] is not None and len(self.state['keys']) == len(mirror) - 1:
+            (header, rows, keys, rows_read) = self.read_changed_rows(mirror)
+        if rows is None:
+            (header, rows, keys, rows_read) = self.read_all_rows()
+        # blank rows at the end of the sheet are not alerts
+        while rows and not any(rows[-1]):
+            rows.pop()
+        keys = keys[:len(rows)] if keys is not None else None
+
+        # rows are compared by content, so that moved rows aren't counted as changed
+        old_rows = [tuple(row) for row in mirror[1:]] if mirror and mirror[0] == header else []
+        old_row_set = set(old_rows)
+        new_row_set = {tuple(row) for row in rows}
+        changed_rows = sum(1 for row in rows if tuple(row) not in old_row_set)
+        removed_rows = sum(1 for row in old_rows if row not in new_row_set) + len(mirror[1:]) - len(old_rows)
+        new_rows = max(len(rows) - len(mirror[1:]), 0)
+        if changed_rows or removed_rows or not mirror:
+            self.write_mirror([header] + rows)
+        # URLs written to rows whose content changed (or which were removed) are written again on next write_urls
+        written_urls = self.state['written_urls']
+        for row_number in list(written_urls):
+            position = int(row_number) - 2
+            if position >= len(rows) or position >= len(old_rows) or tuple(rows[position]) != old_rows[position]:
+                del written_urls[row_number]
+        # revision is only saved once all its changes are in the mirror
+        self.state.update({'revision': revision, 'keys': keys})
+        self.save_state()
+        return {'revision': revision, 'rows': len(rows), 'rows_read': rows_read, 'new_rows': new_rows,
+                'changed_rows': changed_rows, 'removed_rows': removed_rows}
+
+    def write_urls(self, urls, url_column, id_column='UNIQUE_ID', max_rows_per_call=10000):
+        '''
+        Takes in a dict of {id: url}, and writes urls to url_column of rows with these ids (as found in the mirror),
+        skipping urls already written. Consecutive rows are written as a single range, and all ranges in a single
+        batchUpdate call (per max_rows_per_call rows). Returns number of rows written.
+        '''
+        mirror = self.read_mirror()
+        id_position = mirror[0].index(id_column)
+        written_urls = self.state['written_urls']
+        updates = []
+        for (row_number, row) in enumerate(mirror[1:], 2):
+            url = urls.get(row[id_position])
+            if url is None:
+                continue
+            url_hash = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+            if written_urls.get(str(row_number)) != url_hash:
+                updates.append((row_number, url, url_hash))
+
+        for start in range(0, len(updates), max_rows_per_call):
+            batch = updates[start:start + max_rows_per_call]
+            data = []
+            for (row_number, url, _) in batch:
+                if data and data[-1]['last_row'] == row_number - 1:
+                    data[-1]['last_row'] = row_number
+                    data[-1]['values'].append([url])
+                else:
+                    data.append({'first_row': row_number, 'last_row': row_number, 'values': [[url]]})
+            self.values.batchUpdate(spreadsheetId=self.spreadsheet_id, body={
+                'valueInputOption': 'RAW',
+                'data': [{'range': '{}!{}{}:{}{}'.format(self.sheet_name, url_column, entry['first_row'], url_column, entry['last_row']),
+                          'values': entry['values']} for entry in data],
+            }).execute()
+            written_urls.update((str(row_number), url_hash) for (row_number, _, url_hash) in batch)
+            self.save_state()
+        return len(updates)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Syncs the review Google Sheet with the web app input CSV.')
+    parser.add_argument('command', choices=['sync', 'write-urls'])
+    parser.add_argument('--mirror', default='sample_data.csv', help='local CSV mirror of the sheet (web app input CSV)')
+    parser.add_argument('--spreadsheet-id', default=SPREADSHEET_ID)
+    parser.add_argument('--sheet', default=SHEET_NAME)
+    parser.add_argument('--full', action='store_true', help='sync: read all rows, even if the revision didn\'t change')
+    parser.add_argument('--key-column', help='sync: column changing on every edit of its row (e.g. an edit stamp), '
+                                             'only rows whose key changed are read')
+    parser.add_argument('--rebuild-url', help='sync: web app /rebuild URL, requested when rows changed')
+    parser.add_argument('--urls', help='write-urls: precompute_urls.py output file (.csv or .parquet)')
+    parser.add_argument('--url-column', default='J', help='write-urls: sheet column receiving URLs')
+    parser.add_argument('--id-column', default='UNIQUE_ID')
+    args = parser.parse_args()
+
+    from googleapiclient.discovery import build
+    creds = gsheet_api_check(SCOPES)
+    sheet_sync = SheetSync(build('sheets', 'v4', credentials=creds), build('drive', 'v3', credentials=creds),
+                           args.spreadsheet_id, args.sheet, args.mirror, key_column=args.key_column)
+    if args.command == 'sync':
+        result = sheet_sync.sync(full=args.full)
+        print(json.dumps(result))
+        if (result['changed_rows'] or result['removed_rows']) and args.rebuild_url:
+            # the web app rebuilds changed rows only, and keeps serving the current database meanwhile
+            requests.get(args.rebuild_url, timeout=30).raise_for_status()
+    else:
+        columns = [args.id_column, 'base_url']
+        df = pd.read_parquet(args.urls, columns=columns) if args.urls.endswith('.parquet') else pd.read_csv(args.urls, usecols=columns)
+        df = df.dropna(subset=['base_url'])
+        written = sheet_sync.write_urls(dict(zip(df[args.id_column].astype(str), df['base_url'])), args.url_column,
+                                        id_column=args.id_column)
+        print(json.dumps({'written_rows': written}))
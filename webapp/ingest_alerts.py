@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Builds the web app database store from a full alerts export: a CSV file, or a vector file with alert polygons
+(e.g. DETER shapefile or GeoPackage exports, in any CRS), read, deduplicated on ID_COLUMN and written chunk by chunk
+so that memory used doesn't grow with the number of alerts (see web_app.ingest_alerts).
+
+Usage (from the webapp folder, same .env and config as the web app):
+    $ python ingest_alerts.py deter_amz.gpkg --output deter_amz --chunk-size 50000
+
+then set DATABASE_FILE_BASENAME to the output base filename (deter_amz here) and restart the web app.
+Alert polygons are used as AOIs, rows without one (e.g. CSV rows) getting a DEFAULT_RADIUS buffer around
+LAT_COLUMN/LONG_COLUMN. Vector files without these columns get a point inside each polygon.
+'''
+
+import argparse
+import json
+import logging
+import os
+
+import web_app
+
+logger = logging.getLogger('ingest_alerts')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Builds the web app database store from an alerts export.')
+    parser.add_argument('source', help='alerts file: .csv, or any vector file readable by geopandas (.shp, .gpkg...)')
+    parser.add_argument('--output', help='output base filename, .arrow is appended (default: source without extension)')
+    parser.add_argument('--chunk-size', type=int, default=web_app.ingest_chunk_size, help='rows read and built at a time')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s - %(message)s')
+    output = args.output or os.path.splitext(args.source)[0]
+    # the app loads its own database at import, wait for it so that both never build the same store at once
+    web_app.wait_until_ready()
+    stats = web_app.ingest_alerts(args.source, output, chunk_size=args.chunk_size)
+    logger.info('Wrote {} rows to {}.arrow'.format(stats['rows'], output))
+    print(json.dumps(stats))
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import bisect
+from contextlib import contextmanager
+import threading
+import time
+
+# default histogram buckets, in seconds: from sub-millisecond lookups to slow upstream searches
+default_buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labelnames, labelvalues, extra=()):
+    '''
+    Returns labels formatted for the Prometheus text exposition format, e.g. {stage="search",le="0.5"}.
+    '''
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, escape(value)) for (name, value) in pairs) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if value not in (float('inf'), float('-inf')) else ('+Inf' if value > 0 else '-Inf')
+
+
+class Counter:
+    '''
+    Monotonic counter, with one value per combination of label values.
+    '''
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        return [(self.name, format_labels(self.labelnames, key), value) for (key, value) in sorted(values.items())]
+
+
+class Gauge:
+    '''
+    Value read from function when metrics are rendered (e.g. a cache size), with no labels.
+    '''
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, function):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+
+    def samples(self):
+        return [(self.name, '', self.function())]
+
+
+class Histogram:
+    '''
+    Histogram of observed values (usually durations in seconds) over fixed buckets,
+    with one set of buckets per combination of label values.
+    '''
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=default_buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        # label values -> [bucket counts (last one is +Inf), sum]
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        '''
+        Context manager observing the duration of its block, in seconds.
+        '''
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, **labels)
+
+    def samples(self):
+        with self.lock:
+            values = {key: (list(counts), total) for (key, (counts, total)) in self.values.items()}
+        samples = []
+        for (key, (counts, total)) in sorted(values.items()):
+            cumulative = 0
+            for (bound, count) in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = format_labels(self.labelnames, key, [('le', format_value(bound))])
+                samples.append((self.name + '_bucket', labels, cumulative))
+            samples.append((self.name + '_sum', format_labels(self.labelnames, key), total))
+            samples.append((self.name + '_count', format_labels(self.labelnames, key), cumulative))
+        return samples
+
+
+class Registry:
+    '''
+    Collection of metrics, rendered in the Prometheus text exposition format by /metrics.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def register(self, metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError('Metric {} is already registered'.format(metric.name))
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, function):
+        return self.register(Gauge(name, documentation, function))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=default_buckets):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        '''
+        Returns all metrics in the Prometheus text exposition format (version 0.0.4).
+        '''
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append('# HELP {} {}'.format(metric.name, metric.documentation.replace('\n', ' ')))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.type_name))
+            for (name, labels, value) in metric.samples():
+                lines.append('{}{} {}'.format(name, labels, format_value(value)))
+        return '\n'.join(lines) + '\n'
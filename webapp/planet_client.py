@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import Future
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+
+logger = logging.getLogger(__name__)
+
+# status codes worth retrying: rate limited or transient upstream errors
+retry_status_codes = (429, 500, 502, 503, 504)
+
+
+class PlanetAPIError(Exception):
+    '''
+    Raised when the Planet API can't provide a valid response, after retries.
+    '''
+    pass
+
+
+class CircuitOpenError(PlanetAPIError):
+    '''
+    Raised without calling the Planet API while the circuit breaker is open.
+    '''
+    pass
+
+
+class TokenBucket:
+    '''
+    Token bucket rate limiter: allows bursts of up to capacity calls, refilled at rate calls per second.
+    '''
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        '''
+        Blocks until a token is available, then consumes it.
+        '''
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    '''
+    Opens after failure_threshold consecutive failures, then rejects calls for cooldown seconds
+    before letting a single trial call through (half-open state).
+    '''
+
+    def __init__(self, failure_threshold=5, cooldown=30):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                # half-open: let this call through, any failure reopens the circuit
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning('Planet API circuit breaker opened after {} failures'.format(self.failures))
+                self.opened_at = time.monotonic()
+
+
+class PlanetClient:
+    '''
+    Planet Data API client sharing one pooled keep-alive session across calls, with timeouts,
+    token bucket rate limiting, exponential backoff with jitter on 429/5xx and a circuit breaker (opened by connection
+    errors and 5xx, not by 429). Rate limit is per client, i.e. per process.
+    '''
+
+    def __init__(self, api_key, base_url='https://api.planet.com/data/v1', connect_timeout=5, read_timeout=30,
+                 pool_size=10, rate_limit=5, rate_burst=5, max_retries=3, backoff_base=0.5, backoff_max=8,
+                 breaker_threshold=5, breaker_cooldown=30, on_response=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = TokenBucket(rate_limit, rate_burst)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        # called with (method, status code or 'error', duration in seconds) after each upstream call, e.g. for metrics
+        self.on_response = on_response
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.set_api_key(api_key)
+
+    def set_api_key(self, api_key):
+        self.session.auth = HTTPBasicAuth(api_key, '')
+
+    def backoff_delay(self, attempt, retry_after=None):
+        '''
+        Returns seconds to wait before retry number attempt (0-based): Retry-After if provided,
+        else full jitter exponential backoff.
+        '''
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def request(self, method, url, **kwargs):
+        '''
+        Sends a request to url (absolute, or relative to base_url), retrying on connection errors, 429 and 5xx.
+        Returns the decoded JSON body of the response.
+        '''
+        if not url.startswith('http'):
+            url = '{}/{}'.format(self.base_url, url.lstrip('/'))
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError('Planet API circuit breaker is open, not calling {}'.format(url))
+            self.rate_limiter.acquire()
+            retry_after = None
+            start_time = time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if self.on_response:
+                    self.on_response(method, 'error', time.perf_counter() - start_time)
+                self.breaker.record_failure()
+                error = PlanetAPIError('{} {} failed: {}'.format(method, url, e))
+            else:
+                logger.info('{} {} {}'.format(method, url, response.status_code))
+                if self.on_response:
+                    self.on_response(method, response.status_code, time.perf_counter() - start_time)
+                if response.status_code in retry_status_codes:
+                    # a rate limited call means the quota is used up, not that upstream is down: it is retried,
+                    # but doesn't count towards opening the circuit breaker
+                    if response.status_code != 429:
+                        self.breaker.record_failure()
+                    retry_after = response.headers.get('Retry-After')
+                    error = PlanetAPIError('{} {} returned {}'.format(method, url, response.status_code))
+                elif response.status_code >= 400:
+                    # client errors won't be fixed by retrying, and don't reflect upstream health
+                    self.breaker.record_success()
+                    raise PlanetAPIError('{} {} returned {}: {}'.format(method, url, response.status_code, response.text[:200]))
+                else:
+                    self.breaker.record_success()
+                    return response.json()
+            if attempt < self.max_retries:
+                delay = self.backoff_delay(attempt, retry_after)
+                logger.warning('{}, retrying in {:.2f}s'.format(error, delay))
+                time.sleep(delay)
+        raise error
+
+    def quick_search_pages(self, search_request, page_size=250):
+        '''
+        Generator over quick-search result pages (lists of features), following _links._next.
+        Next page is only requested when the previous one has been consumed, so callers can stop early.
+        '''
+        page = self.request('POST', 'quick-search', params={'_page_size': page_size}, json=search_request)
+        while True:
+            yield page['features']
+            next_url = page.get('_links', {}).get('_next')
+            if not next_url or not page['features']:
+                return
+            page = self.request('GET', next_url)
+
+
+class SingleFlight:
+    '''
+    Coalesces concurrent calls sharing the same key: the first caller runs the function,
+    callers arriving while it runs wait for, and share, its result (or exception).
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.coalesced = 0
+
+    def do(self, key, function):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return call.result()
+        try:
+            result = function()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.calls[key]
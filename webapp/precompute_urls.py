@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Precomputes Planet Explorer URLs (base_url column) for every row of the web app database.
+
+Usage (from the webapp folder, same .env and config as the web app):
+    $ python precompute_urls.py --output urls.csv --workers 8
+
+Rows whose AOIs and date windows overlap are grouped, and each group shares a single quick-search (see
+web_app.search_group), unless --no-batching is set.
+
+Computed URLs are also stored in the web app redirect table (REDIRECT_TABLE_FILE) if enabled.
+
+Progress is checkpointed to <output>.checkpoint.jsonl as rows complete, so that an interrupted run
+can be started again with the same command and resumes where it stopped.
+'''
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import web_app
+
+logger = logging.getLogger('precompute_urls')
+
+
+def load_checkpoint(checkpoint_file):
+    '''
+    Returns a dict of {id: url} already computed in a previous run, read from checkpoint_file.
+    '''
+    urls = {}
+    if os.path.exists(checkpoint_file):
+        with open(checkpoint_file) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # last line may be truncated if previous run was killed while writing it
+                    continue
+                urls[entry['id']] = entry['url']
+    return urls
+
+
+def compute_batch(database, positions):
+    '''
+    Returns URLs of rows at positions: one search per row for a single row, else one shared search.
+    '''
+    if len(positions) == 1:
+        return [web_app.compute_url(database.row(positions[0]))]
+    return web_app.compute_group_urls(database.take(positions))
+
+
+def compute_urls(database, urls, checkpoint_file, workers=4, progress_every=100, batching=True):
+    '''
+    Runs compute_url on every row of database whose id is not already in urls, with at most workers concurrent
+    batches of rows in progress (see compute_batch). Each result is added to urls and appended to checkpoint_file.
+    Returns number of rows which failed (not checkpointed, retried on next run).
+    '''
+    uids = database.column(web_app.ID).tolist()
+    todo = np.array([uid not in urls for uid in uids], dtype=bool)
+    total = int(todo.sum())
+    logger.info('{} rows to compute, {} already done'.format(total, len(database) - total))
+    if batching:
+        batches = [group[todo[group]] for group in web_app.plan_batches(database)]
+        batches = [batch for batch in batches if len(batch)]
+        logger.info('{} rows grouped in {} searches'.format(total, len(batches)))
+    else:
+        batches = [[pos] for pos in np.flatnonzero(todo)]
+
+    done = failed = 0
+    start_time = time.perf_counter()
+    with open(checkpoint_file, 'a') as checkpoint, ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        remaining = iter(batches)
+        next_progress = progress_every
+        while True:
+            # keep a bounded number of batches in flight, rather than submitting the whole database at once
+            for positions in remaining:
+                pending[executor.submit(compute_batch, database, positions)] = [uids[pos] for pos in positions]
+                if len(pending) >= workers * 2:
+                    break
+            if not pending:
+                break
+            completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in completed:
+                batch_uids = pending.pop(future)
+                try:
+                    batch_urls = future.result()
+                except Exception as e:
+                    failed += len(batch_uids)
+                    logger.warning('ids {} failed: {}'.format(batch_uids, e))
+                    continue
+                for (uid, url) in zip(batch_uids, batch_urls):
+                    urls[uid] = url
+                    checkpoint.write(json.dumps({'id': uid, 'url': url}) + '\n')
+                done += len(batch_uids)
+                if done >= next_progress:
+                    next_progress = done + progress_every
+                    checkpoint.flush()
+                    elapsed = time.perf_counter() - start_time
+                    rate = done/elapsed
+                    logger.info('{}/{} rows done, {:.1f} rows/sec, {} failed, ETA {:.0f}s'.format(
+                        done, total, rate, failed, (total - done - failed)/rate))
+
+    elapsed = time.perf_counter() - start_time
+    logger.info('{} rows done in {:.1f}s ({:.1f} rows/sec), {} failed'.format(
+        done, elapsed, done/elapsed if elapsed > 0 else 0, failed))
+    return failed
+
+
+def write_output(database, urls, output_file):
+    '''
+    Writes database columns along with computed base_url column to output_file (CSV or Parquet, based on extension).
+    '''
+    df = pd.DataFrame(database.to_geodataframe().drop(columns=['UNIX_TIMES', 'geometry', 'wkt']))
+    df[web_app.REFERENCE_DATE] = df[web_app.REFERENCE_DATE].dt.strftime(web_app.REFERENCE_DATE_FORMAT)
+    df['base_url'] = df[web_app.ID].map(urls)
+    if output_file.endswith('.parquet'):
+        df.to_parquet(output_file, index=False)
+    else:
+        df.to_csv(output_file, index=False)
+    logger.info('{} rows written to {}'.format(len(df), output_file))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precomputes Planet Explorer URLs for every row of the database.')
+    parser.add_argument('--output', default='{}_urls.csv'.format(web_app.database_file_base_name),
+                        help='output file, .csv or .parquet')
+    parser.add_argument('--checkpoint', default=None, help='checkpoint file (default: <output>.checkpoint.jsonl)')
+    parser.add_argument('--workers', type=int, default=4, help='max number of rows computed concurrently')
+    parser.add_argument('--progress-every', type=int, default=100, help='log progress every N rows')
+    parser.add_argument('--no-batching', action='store_true', help='run one search per row, rather than shared searches')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s - %(message)s')
+    checkpoint_file = args.checkpoint or '{}.checkpoint.jsonl'.format(args.output)
+
+    if not web_app.wait_until_ready():
+        raise SystemExit('Unable to load the database: {}'.format(web_app.warmup_status['error']))
+    urls = load_checkpoint(checkpoint_file)
+    failed = compute_urls(web_app.db_snapshot.database, urls, checkpoint_file, workers=args.workers,
+                          progress_every=args.progress_every, batching=not args.no_batching)
+    write_output(web_app.db_snapshot.database, urls, args.output)
+    if web_app.redirect_table:
+        # the web app then serves these URLs without any upstream call
+        web_app.seed_redirect_table(web_app.db_snapshot.database, urls)
+    if failed:
+        logger.warning('{} rows failed, run the same command again to retry them'.format(failed))
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+
+from sqlite_store import SQLiteStore
+
+
+class RedirectTable(SQLiteStore):
+    '''
+    Disk-backed (SQLite) table of Planet Explorer URLs computed with default parameters, keyed on row id.
+    Each entry is stored along with the version of the row inputs it was computed from (AOI, date window, filters),
+    so that entries of rows changed by a database rebuild or a configuration change are never served.
+    Entries older than max_age seconds are still served ("stale"), and are meant to be refreshed in the background.
+    '''
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS redirects (
+            id INTEGER PRIMARY KEY,
+            version TEXT NOT NULL,
+            url TEXT NOT NULL,
+            computed_at REAL NOT NULL
+        );
+    '''
+
+    def __init__(self, path, max_age=86400):
+        self.max_age = max_age
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        super().__init__(path)
+
+    def get(self, uid, version):
+        '''
+        Returns a (url, stale) tuple for uid if an entry computed from version exists, else None.
+        An empty url means no scene was found.
+        '''
+        with self.lock:
+            entry = self.connection.execute(
+                'SELECT url, computed_at FROM redirects WHERE id = ? AND version = ?', (uid, version)).fetchone()
+            if entry is None:
+                self.misses += 1
+                return None
+            stale = entry[1] < time.time() - self.max_age
+            if stale:
+                self.stale_hits += 1
+            else:
+                self.hits += 1
+        return entry[0], stale
+
+    def set(self, uid, version, url, computed_at=None):
+        '''
+        Stores url (None or empty if no scene was found) for uid, computed from version at computed_at (Unix time,
+        default now).
+        '''
+        self.set_many([(uid, version, url)], computed_at)
+
+    def set_many(self, entries, computed_at=None):
+        '''
+        Stores (uid, version, url) entries at once, e.g. when seeding the table from precompute_urls.py results.
+        '''
+        computed_at = time.time() if computed_at is None else computed_at
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO redirects (id, version, url, computed_at) VALUES (?, ?, ?, ?)',
+                [(uid, version, url or '', computed_at) for (uid, version, url) in entries])
+
+    def stats(self):
+        '''
+        Returns a dict of hit/stale hit/miss counters, and number of entries.
+        '''
+        with self.lock:
+            entries = self.connection.execute('SELECT COUNT(*) FROM redirects').fetchone()[0]
+        return {'hits': self.hits, 'stale_hits': self.stale_hits, 'misses': self.misses, 'entries': entries}
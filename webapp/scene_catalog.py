@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+import json
+import time
+
+import numpy as np
+import shapely
+import shapely.geometry
+
+from sqlite_store import SQLiteStore
+
+seconds_per_day = 86400
+
+
+def iso_to_timestamp(iso_date):
+    '''
+    Takes in an ISO date string (e.g. 2020-07-13T00:00:00Z or a scene acquired date), returns Unix time in seconds.
+    '''
+    date = datetime.datetime.fromisoformat(iso_date.replace('Z', ''))
+    return date.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+def timestamp_to_iso(timestamp):
+    '''
+    Takes in Unix time in seconds, returns an ISO date string formatted like create_times ones.
+    '''
+    return datetime.datetime.utcfromtimestamp(timestamp).isoformat()+'Z'
+
+
+class SceneCatalog(SQLiteStore):
+    '''
+    Local catalog (SQLite file, with R-tree indexes) of scenes harvested from quick-search results, along with the
+    areas, date windows and cloud cover limits which were fully harvested ("coverage").
+    Searches whose AOI and window are covered by harvested ones can be answered without calling the Planet API,
+    whatever their radius, shape or window. Windows ending less than settle_days before harvest are only covered
+    up to that date, since new scenes may still be published for the last days.
+    The catalog keeps at most max_scenes scenes (those acquired last) and max_coverage covered areas (those harvested
+    last), and only the max_candidates covered areas harvested last are used to answer a search.
+    '''
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS scenes (
+            rowid INTEGER PRIMARY KEY,
+            id TEXT NOT NULL UNIQUE,
+            acquired REAL NOT NULL,
+            cloud_cover REAL NOT NULL,
+            footprint BLOB NOT NULL,
+            feature TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS scenes_acquired ON scenes (acquired);
+        CREATE INDEX IF NOT EXISTS scenes_cloud_cover ON scenes (cloud_cover);
+        CREATE VIRTUAL TABLE IF NOT EXISTS scenes_rtree USING rtree(rowid, min_x, max_x, min_y, max_y);
+        CREATE TABLE IF NOT EXISTS coverage (
+            rowid INTEGER PRIMARY KEY,
+            area BLOB NOT NULL,
+            window_start REAL NOT NULL,
+            window_end REAL NOT NULL,
+            max_cloud_cover REAL NOT NULL,
+            harvested_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS coverage_harvested_at ON coverage (harvested_at);
+        CREATE VIRTUAL TABLE IF NOT EXISTS coverage_rtree USING rtree(rowid, min_x, max_x, min_y, max_y);
+    '''
+
+    def __init__(self, path, settle_days=2, max_scenes=100000, max_coverage=10000, max_candidates=32):
+        self.settle_days = settle_days
+        self.max_scenes = max_scenes
+        self.max_coverage = max_coverage
+        self.max_candidates = max_candidates
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        super().__init__(path)
+
+    def harvest(self, area, start, end, max_cloud_cover, features, complete=True):
+        '''
+        Stores features returned by a search over area (shapely geometry), start/end ISO dates and max cloud cover
+        (fraction, like in quick-search requests). If complete (all result pages were read), the window is also
+        recorded as covered over area, up to settle_days ago (see add_coverage). Scenes and covered areas above
+        max_scenes and max_coverage are then evicted.
+        '''
+        now = time.time()
+        with self.lock, self.connection:
+            for feature in features:
+                footprint = shapely.geometry.shape(feature['geometry'])
+                cursor = self.connection.execute(
+                    'INSERT OR IGNORE INTO scenes (id, acquired, cloud_cover, footprint, feature) VALUES (?, ?, ?, ?, ?)',
+                    (feature['id'], iso_to_timestamp(feature['properties']['acquired']),
+                     feature['properties'].get('cloud_cover', 0), shapely.to_wkb(footprint), json.dumps(feature)))
+                if cursor.rowcount:
+                    min_x, min_y, max_x, max_y = footprint.bounds
+                    self.connection.execute('INSERT INTO scenes_rtree VALUES (?, ?, ?, ?, ?)',
+                                            (cursor.lastrowid, min_x, max_x, min_y, max_y))
+            start = iso_to_timestamp(start)
+            end = min(iso_to_timestamp(end), now - self.settle_days * seconds_per_day)
+            if complete and end > start:
+                self.add_coverage(area, start, end, max_cloud_cover, now)
+            self.evict()
+
+    def add_coverage(self, area, start, end, max_cloud_cover, now):
+        '''
+        Records area as covered over start/end Unix times, unless an already covered area contains it over the whole
+        window. Covered areas it contains are replaced, and windows of the same area are merged when they overlap,
+        so that repeated searches over the same alert don't add rows. Called by harvest, holding the lock.
+        '''
+        min_x, min_y, max_x, max_y = area.bounds
+        rows = self.connection.execute('''
+            SELECT coverage.rowid, coverage.area, coverage.window_start, coverage.window_end, coverage.max_cloud_cover
+            FROM coverage JOIN coverage_rtree ON coverage.rowid = coverage_rtree.rowid
+            WHERE coverage_rtree.min_x <= ? AND coverage_rtree.max_x >= ?
+              AND coverage_rtree.min_y <= ? AND coverage_rtree.max_y >= ?
+              AND coverage.window_start <= ? AND coverage.window_end >= ?
+            ORDER BY coverage.harvested_at DESC LIMIT ?''',
+            (max_x, min_x, max_y, min_y, end, start, self.max_candidates)).fetchall()
+        replaced = []
+        for (rowid, row_area, row_start, row_end, row_cloud_cover) in rows:
+            row_area = shapely.from_wkb(row_area)
+            if row_cloud_cover >= max_cloud_cover and row_start <= start and row_end >= end and row_area.covers(area):
+                return
+            if row_cloud_cover <= max_cloud_cover and start <= row_start and end >= row_end and area.covers(row_area):
+                replaced.append(rowid)
+            elif row_cloud_cover == max_cloud_cover and row_area.equals(area):
+                start, end = min(start, row_start), max(end, row_end)
+                replaced.append(rowid)
+        self.delete_coverage(replaced)
+        cursor = self.connection.execute(
+            'INSERT INTO coverage (area, window_start, window_end, max_cloud_cover, harvested_at) VALUES (?, ?, ?, ?, ?)',
+            (shapely.to_wkb(area), start, end, max_cloud_cover, now))
+        self.connection.execute('INSERT INTO coverage_rtree VALUES (?, ?, ?, ?, ?)',
+                                (cursor.lastrowid, min_x, max_x, min_y, max_y))
+
+    def delete_coverage(self, rowids):
+        '''
+        Removes covered areas (and their R-tree entries) of rowids. Called holding the lock.
+        '''
+        for rowid in rowids:
+            self.connection.execute('DELETE FROM coverage WHERE rowid = ?', (rowid,))
+            self.connection.execute('DELETE FROM coverage_rtree WHERE rowid = ?', (rowid,))
+
+    def evict(self):
+        '''
+        Removes scenes acquired first above max_scenes, along with covered areas whose window starts before the last
+        removed scene (which wouldn't be fully harvested anymore), then covered areas harvested first above
+        max_coverage. Called holding the lock.
+        '''
+        cutoff = self.connection.execute('SELECT acquired FROM scenes ORDER BY acquired DESC LIMIT 1 OFFSET ?',
+                                         (self.max_scenes,)).fetchone()
+        if cutoff is not None:
+            self.connection.execute('DELETE FROM scenes_rtree WHERE rowid IN (SELECT rowid FROM scenes WHERE acquired <= ?)', cutoff)
+            self.connection.execute('DELETE FROM scenes WHERE acquired <= ?', cutoff)
+            self.delete_coverage([row[0] for row in self.connection.execute(
+                'SELECT rowid FROM coverage WHERE window_start <= ?', cutoff).fetchall()])
+        self.delete_coverage([row[0] for row in self.connection.execute(
+            'SELECT rowid FROM coverage ORDER BY harvested_at DESC LIMIT -1 OFFSET ?', (self.max_coverage,)).fetchall()])
+
+    def uncovered_ranges(self, area, start, end, max_cloud_cover):
+        '''
+        Takes in a search area, start/end Unix times and max cloud cover (fraction), and returns the list of
+        (start, end) time ranges of the window over which area was not fully harvested. Only the max_candidates
+        covered areas harvested last are used, so that the cost of a lookup doesn't grow with harvests of a region.
+        '''
+        min_x, min_y, max_x, max_y = area.bounds
+        with self.lock:
+            candidates = self.connection.execute('''
+                SELECT coverage.area, coverage.window_start, coverage.window_end FROM coverage
+                JOIN coverage_rtree ON coverage.rowid = coverage_rtree.rowid
+                WHERE coverage_rtree.min_x <= ? AND coverage_rtree.max_x >= ?
+                  AND coverage_rtree.min_y <= ? AND coverage_rtree.max_y >= ?
+                  AND coverage.max_cloud_cover >= ? AND coverage.window_start < ? AND coverage.window_end > ?
+                ORDER BY coverage.harvested_at DESC LIMIT ?''',
+                (max_x, min_x, max_y, min_y, max_cloud_cover, end, start, self.max_candidates)).fetchall()
+        if not candidates:
+            return [(start, end)]
+        areas = shapely.from_wkb([candidate[0] for candidate in candidates])
+        starts = np.array([candidate[1] for candidate in candidates])
+        ends = np.array([candidate[2] for candidate in candidates])
+        # areas covering the search area by themselves spare the union of active areas
+        covering = shapely.covers(areas, area)
+
+        # split window on coverage bounds, a range is covered if the union of areas covering all of it contains area
+        bounds = np.unique(np.clip(np.concatenate([[start, end], starts, ends]), start, end))
+        uncovered = []
+        for (range_start, range_end) in zip(bounds[:-1], bounds[1:]):
+            active = (starts <= range_start) & (ends >= range_end)
+            if (covering & active).any() or (active.any() and shapely.union_all(areas[active]).covers(area)):
+                continue
+            if uncovered and uncovered[-1][1] == range_start:
+                uncovered[-1] = (uncovered[-1][0], float(range_end))
+            else:
+                uncovered.append((float(range_start), float(range_end)))
+        return uncovered
+
+    def scenes(self, area, start, end, max_cloud_cover):
+        '''
+        Takes in a search area, start/end Unix times (inclusive) and max cloud cover (fraction), and returns the
+        harvested features intersecting area, acquired within window and below max cloud cover.
+        '''
+        min_x, min_y, max_x, max_y = area.bounds
+        with self.lock:
+            rows = self.connection.execute('''
+                SELECT scenes.footprint, scenes.feature FROM scenes
+                JOIN scenes_rtree ON scenes.rowid = scenes_rtree.rowid
+                WHERE scenes_rtree.min_x <= ? AND scenes_rtree.max_x >= ?
+                  AND scenes_rtree.min_y <= ? AND scenes_rtree.max_y >= ?
+                  AND scenes.acquired >= ? AND scenes.acquired <= ? AND scenes.cloud_cover <= ?''',
+                (max_x, min_x, max_y, min_y, start, end, max_cloud_cover)).fetchall()
+        if not rows:
+            return []
+        intersecting = shapely.intersects(area, shapely.from_wkb([row[0] for row in rows]))
+        return [json.loads(row[1]) for (row, keep) in zip(rows, intersecting) if keep]
+
+    def search(self, area, start, end, max_cloud_cover):
+        '''
+        Takes in a search area (shapely geometry), start/end ISO dates and max cloud cover (fraction), and returns
+        a (features, uncovered ranges) tuple: harvested features matching the search, and (start, end) ISO date
+        ranges of the window which still have to be searched upstream. Features are None if nothing is covered.
+        '''
+        start, end = iso_to_timestamp(start), iso_to_timestamp(end)
+        uncovered = self.uncovered_ranges(area, start, end, max_cloud_cover)
+        if uncovered == [(start, end)]:
+            self.misses += 1
+            return None, [(timestamp_to_iso(start), timestamp_to_iso(end))]
+        if uncovered:
+            self.partial_hits += 1
+        else:
+            self.hits += 1
+        return (self.scenes(area, start, end, max_cloud_cover),
+                [(timestamp_to_iso(range_start), timestamp_to_iso(range_end)) for (range_start, range_end) in uncovered])
+
+    def stats(self):
+        '''
+        Returns a dict of hit/partial hit/miss counters, and numbers of scenes and covered areas.
+        '''
+        with self.lock:
+            scenes = self.connection.execute('SELECT COUNT(*) FROM scenes').fetchone()[0]
+            coverage = self.connection.execute('SELECT COUNT(*) FROM coverage').fetchone()[0]
+        return {'hits': self.hits, 'partial_hits': self.partial_hits, 'misses': self.misses,
+                'scenes': scenes, 'covered_areas': coverage}
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import calendar
+import datetime
+import hashlib
+import json
+import time
+
+from sqlite_store import SQLiteStore
+
+seconds_per_day = 86400
+
+
+def make_search_key(coord_list, earlier_time, later_time, max_cloud_cover, item_type):
+    '''
+    Takes in quick-search parameters, and returns a stable hash of the normalized request
+    (coordinates rounded to 1e-6 degree, i.e. ~10 cm, so that float noise doesn't create new keys).
+    '''
+    normalized = {
+        'coordinates': [[round(float(num), 6) for num in pair] for pair in coord_list],
+        'gte': earlier_time,
+        'lte': later_time,
+        'cloud_cover': float(max_cloud_cover),
+        'item_type': item_type,
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def iso_to_unix(iso_date):
+    '''
+    Takes in an ISO date string as built by create_times (e.g. 2020-07-13T00:00:00Z), returns Unix time in seconds.
+    '''
+    date = datetime.datetime.fromisoformat(iso_date.replace('Z', ''))
+    return calendar.timegm(date.timetuple())
+
+
+class SearchCache(SQLiteStore):
+    '''
+    Disk-backed (SQLite) cache of Planet quick-search features, with TTL and LRU eviction.
+    Date windows ending more than settle_days ago won't get new scenes anymore and are kept for past_ttl seconds,
+    windows reaching into the present are kept for recent_ttl seconds only.
+    '''
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS search_cache (
+            key TEXT PRIMARY KEY,
+            features TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS search_cache_last_access ON search_cache (last_access);
+    '''
+
+    def __init__(self, path, max_entries=10000, past_ttl=30 * seconds_per_day, recent_ttl=3600, settle_days=2):
+        self.max_entries = max_entries
+        self.past_ttl = past_ttl
+        self.recent_ttl = recent_ttl
+        self.settle_days = settle_days
+        self.hits = 0
+        self.misses = 0
+        super().__init__(path)
+
+    def ttl(self, later_time):
+        '''
+        Returns TTL in seconds for a date window ending at later_time (ISO string).
+        '''
+        if iso_to_unix(later_time) < time.time() - self.settle_days * seconds_per_day:
+            return self.past_ttl
+        return self.recent_ttl
+
+    def get(self, key):
+        '''
+        Returns cached features list for key, or None if missing or expired.
+        '''
+        now = time.time()
+        with self.lock:
+            entry = self.connection.execute(
+                'SELECT features FROM search_cache WHERE key = ? AND expires_at > ?', (key, now)).fetchone()
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self.connection:
+                self.connection.execute('UPDATE search_cache SET last_access = ? WHERE key = ?', (now, key))
+        return json.loads(entry[0])
+
+    def set(self, key, features, later_time):
+        '''
+        Stores features list for key, then evicts expired and least recently used entries above max_entries.
+        '''
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO search_cache (key, features, expires_at, last_access) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(features), now + self.ttl(later_time), now))
+            self.connection.execute('DELETE FROM search_cache WHERE expires_at <= ?', (now,))
+            self.connection.execute('''
+                DELETE FROM search_cache WHERE key IN (
+                    SELECT key FROM search_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )''', (self.max_entries,))
+
+    def invalidate(self):
+        '''
+        Removes all entries, returns number of entries removed.
+        '''
+        with self.lock, self.connection:
+            return self.connection.execute('DELETE FROM search_cache').rowcount
+
+    def stats(self):
+        '''
+        Returns a dict of hit/miss counters and current number of entries.
+        '''
+        with self.lock:
+            entries = self.connection.execute('SELECT COUNT(*) FROM search_cache').fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'max_entries': self.max_entries}
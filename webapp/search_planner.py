@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import shapely
+
+
+def plan_search_groups(bounds, starts, ends, max_group_size=50, max_extent=0.5, max_window=90 * 86400):
+    '''
+    Takes in AOI bounding boxes ((n, 4) array of min x, min y, max x, max y) and search windows (start/end arrays,
+    in any numeric time unit) of n alerts, and returns a list of position arrays: groups of alerts whose AOIs and
+    windows overlap (directly or through other alerts of the group), which can share a single search.
+    Groups are grown from the earliest alert not yet grouped, and are capped to max_group_size alerts, a bounding
+    box of at most max_extent (in bounds units) wide and high, and a window of at most max_window long,
+    so that the shared search stays close to the searches it replaces.
+    '''
+    bounds = np.asarray(bounds, dtype=float)
+    starts = np.asarray(starts)
+    ends = np.asarray(ends)
+    tree = shapely.STRtree(shapely.box(bounds[:, 0], bounds[:, 1], bounds[:, 2], bounds[:, 3]))
+    grouped = np.zeros(len(bounds), dtype=bool)
+    groups = []
+    for seed in np.argsort(starts, kind='stable'):
+        if grouped[seed]:
+            continue
+        grouped[seed] = True
+        group = [seed]
+        group_bounds = bounds[seed].copy()
+        group_start, group_end = starts[seed], ends[seed]
+        frontier = [seed]
+        while frontier and len(group) < max_group_size:
+            candidates = tree.query(shapely.box(*bounds[frontier.pop()]))
+            for candidate in np.sort(candidates[~grouped[candidates]]):
+                if len(group) >= max_group_size:
+                    break
+                if starts[candidate] > group_end or ends[candidate] < group_start:
+                    continue
+                merged_bounds = np.concatenate([np.minimum(group_bounds[:2], bounds[candidate, :2]),
+                                                np.maximum(group_bounds[2:], bounds[candidate, 2:])])
+                merged_start, merged_end = min(group_start, starts[candidate]), max(group_end, ends[candidate])
+                if (merged_bounds[2] - merged_bounds[0] > max_extent or merged_bounds[3] - merged_bounds[1] > max_extent
+                        or merged_end - merged_start > max_window):
+                    continue
+                grouped[candidate] = True
+                group.append(candidate)
+                group_bounds = merged_bounds
+                group_start, group_end = merged_start, merged_end
+                frontier.append(candidate)
+        groups.append(np.array(group))
+    return groups
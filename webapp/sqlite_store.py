@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sqlite3
+import threading
+
+
+class SQLiteStore:
+    '''
+    Base class of the SQLite files of the app (search cache, scene catalog, redirect table): a connection shared by
+    request threads, along with the lock serializing its use. Tables of schema (an SQL script of CREATE ... IF NOT
+    EXISTS statements) are created when the file is opened.
+    '''
+
+    schema = ''
+
+    def __init__(self, path):
+        self.path = path
+        self.reconnect()
+        with self.connection:
+            self.connection.executescript(self.schema)
+
+    def reconnect(self):
+        '''
+        Opens a new connection to the store file. Used by worker processes forked after it was opened (e.g. by a
+        preloading server), since SQLite connections must not be used across fork.
+        '''
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Tests of alert_index.AlertIndex (alerts whose AOI intersects an area, in a date range) and alert_index.IdIndex.
+
+Run from the webapp folder:
+    $ python -m pytest tests
+'''
+
+import os
+import sys
+
+import numpy as np
+import pyarrow as pa
+import shapely
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from alert_index import AlertIndex, IdIndex
+
+
+class FakeDatabase:
+    '''
+    Arrow table with the columns AlertIndex reads from an AlertDatabase: reference dates and WKB AOIs.
+    '''
+
+    def __init__(self, dates, geometries):
+        self.table = pa.table({'date': np.array(dates, dtype='datetime64[ns]'), 'geometry': shapely.to_wkb(geometries)})
+
+    def column(self, name):
+        return self.table.column(name).to_numpy()
+
+
+# triangles 0 and 3 have overlapping bounding boxes, but not AOIs
+geometries = [
+    shapely.Polygon([(0, 0), (10, 0), (0, 10)]),
+    shapely.Point(20, 20).buffer(1),
+    shapely.box(1, 1, 2, 2),
+    shapely.Polygon([(10, 10), (2, 10), (10, 2)]),
+]
+dates = ['2020-07-03', '2020-07-01', '2020-07-02', '2020-07-04']
+
+
+def test_alerts_intersecting_area_by_their_aoi():
+    # two chunks of WKB decoded while building
+    index = AlertIndex(FakeDatabase(dates, geometries), 'date', chunk_size=3)
+    # areas away from the centroids of the triangles they intersect
+    assert index.query(shapely.box(4, 3, 5, 4)).tolist() == [0]
+    assert index.query(shapely.box(8.5, 8.5, 9.5, 9.5)).tolist() == [3]
+    assert index.query(shapely.box(0.5, 0.5, 3, 3)).tolist() == [2, 0]
+    assert index.query(shapely.box(12, 12, 13, 13)).tolist() == []
+
+
+def test_area_and_date_range():
+    index = AlertIndex(FakeDatabase(dates, geometries), 'date')
+    area = shapely.box(-1, -1, 30, 30)
+    assert index.query(area).tolist() == [1, 2, 0, 3]
+    assert index.query(area, start=np.datetime64('2020-07-02'), end=np.datetime64('2020-07-03')).tolist() == [2, 0]
+    assert index.query(start=np.datetime64('2020-07-04')).tolist() == [3]
+
+
+def test_empty_database():
+    index = AlertIndex(FakeDatabase([], []), 'date')
+    assert index.query(shapely.box(0, 0, 1, 1)).tolist() == []
+
+
+def test_id_index():
+    index = IdIndex(np.array([5, 3, 5, 9]))
+    assert (len(index), index.get(5), index.get(3), index[9], index.get(4)) == (3, 0, 1, 3, None)
+    assert index.get('not an id') is None
+    assert index.get_positions([9, 4, 5]).tolist() == [3, -1, 0]
+    assert IdIndex([]).get_positions([1]).tolist() == [-1]
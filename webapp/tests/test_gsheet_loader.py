@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Tests of gsheet_loader.SheetSync against fake Sheets and Drive services.
+
+Run from the webapp folder:
+    $ python -m pytest tests
+'''
+
+import csv
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gsheet_loader import SheetSync
+
+
+class FakeRequest:
+
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        return self.result
+
+
+class FakeSheet:
+    '''
+    Fake Sheets (spreadsheets().values()) and Drive (files()) services over a list of rows, header first.
+    The revision is bumped on every edit, like the Drive file version. If stamped, edited rows get the revision in
+    an extra last column, like an edit stamp set by an onEdit trigger.
+    '''
+
+    def __init__(self, rows, stamped=False):
+        self.rows = [list(row) for row in rows]
+        self.stamped = stamped
+        self.revision = 1
+        self.batch_gets = 0
+        self.cells_read = 0
+        self.updates = []
+
+    def edit(self, row_number, row):
+        row = list(row) + ([str(self.revision)] if self.stamped else [])
+        if row_number > len(self.rows):
+            self.rows.append(row)
+        else:
+            self.rows[row_number - 1] = row
+        self.revision += 1
+
+    def delete(self, row_number):
+        del self.rows[row_number - 1]
+        self.revision += 1
+
+    # Drive service
+    def files(self):
+        return self
+
+    def get(self, fileId, fields):
+        return FakeRequest({'version': str(self.revision)})
+
+    # Sheets service
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def batchGet(self, spreadsheetId, ranges, **kwargs):
+        self.batch_gets += 1
+        value_ranges = []
+        for value_range in ranges:
+            (first_column, first_row, last_column, last_row) = re.match(r'.*!([A-Z])(\d+):([A-Z])(\d*)$', value_range).groups()
+            columns = slice(ord(first_column) - ord('A'), ord(last_column) - ord('A') + 1)
+            values = [row[columns] for row in self.rows[int(first_row) - 1:int(last_row or len(self.rows))]]
+            # like the API, trailing empty cells and rows are omitted
+            values = [row[:max([i + 1 for (i, value) in enumerate(row) if value != ''] or [0])] for row in values]
+            while values and not values[-1]:
+                values.pop()
+            self.cells_read += sum(len(row) for row in values)
+            value_ranges.append({'values': values})
+        return FakeRequest({'valueRanges': value_ranges})
+
+    def batchUpdate(self, spreadsheetId, body):
+        self.updates.append(body)
+        return FakeRequest({})
+
+
+def make_sync(sheet, tmp_path, **kwargs):
+    return SheetSync(sheet, sheet, 'spreadsheet', 'alerts', str(tmp_path / 'mirror.csv'), **kwargs)
+
+
+def make_stamped_sheet(row_count):
+    sheet = FakeSheet([['UNIQUE_ID', 'LAT', 'EDITED']], stamped=True)
+    for i in range(row_count):
+        sheet.edit(i + 2, [str(i), '-7.{}'.format(i)])
+    return sheet
+
+
+def mirror_rows(sheet):
+    # mirror has columns A:B, without the edit stamp
+    return [row[:2] for row in sheet.rows]
+
+
+def read_csv(path):
+    with open(path, newline='') as f:
+        return list(csv.reader(f))
+
+
+def test_first_sync_pulls_all_rows(tmp_path):
+    sheet = FakeSheet([['UNIQUE_ID', 'LAT'], ['1', '-7.1'], ['2', '-7.2']])
+    result = make_sync(sheet, tmp_path).sync()
+    assert (result['rows'], result['new_rows'], result['changed_rows'], result['removed_rows']) == (2, 2, 2, 0)
+    assert read_csv(tmp_path / 'mirror.csv') == sheet.rows
+
+
+def test_unchanged_revision_is_not_read(tmp_path):
+    sheet = FakeSheet([['UNIQUE_ID', 'LAT'], ['1', '-7.1']])
+    make_sync(sheet, tmp_path).sync()
+    result = make_sync(sheet, tmp_path).sync()
+    assert sheet.batch_gets == 1
+    assert result['changed_rows'] == 0
+
+
+def test_edit_of_synced_row_is_pulled(tmp_path):
+    sheet = FakeSheet([['UNIQUE_ID', 'LAT'], ['1', '-7.1'], ['2', '-7.2']])
+    make_sync(sheet, tmp_path).sync()
+    sheet.edit(2, ['1', '-8.1'])
+    result = make_sync(sheet, tmp_path).sync()
+    assert (result['new_rows'], result['changed_rows'], result['removed_rows']) == (0, 1, 1)
+    assert read_csv(tmp_path / 'mirror.csv') == sheet.rows
+    # and isn't lost on next sync
+    assert make_sync(sheet, tmp_path).sync()['changed_rows'] == 0
+    assert read_csv(tmp_path / 'mirror.csv') == sheet.rows
+
+
+def test_edit_and_append_are_pulled(tmp_path):
+    sheet = FakeSheet([['UNIQUE_ID', 'LAT'], ['1', '-7.1'], ['2', '-7.2']])
+    make_sync(sheet, tmp_path).sync()
+    sheet.edit(3, ['2', '-8.2'])
+    sheet.edit(4, ['3', '-7.3'])
+    result = make_sync(sheet, tmp_path).sync()
+    assert (result['rows'], result['new_rows'], result['changed_rows']) == (3, 1, 2)
+    assert read_csv(tmp_path / 'mirror.csv') == sheet.rows
+
+
+def test_urls_of_edited_rows_are_written_again(tmp_path):
+    sheet = FakeSheet([['UNIQUE_ID', 'LAT'], ['1', '-7.1'], ['2', '-7.2']])
+    make_sync(sheet, tmp_path).sync()
+    urls = {'1': 'https://example.com/1', '2': 'https://example.com/2'}
+    assert make_sync(sheet, tmp_path).write_urls(urls, 'J') == 2
+    assert make_sync(sheet, tmp_path).write_urls(urls, 'J') == 0
+    sheet.edit(3, ['2', '-8.2'])
+    make_sync(sheet, tmp_path).sync()
+    assert make_sync(sheet, tmp_path).write_urls(urls, 'J') == 1
+    assert sheet.updates[-1]['data'] == [{'range': 'alerts!J3:J3', 'values': [['https://example.com/2']]}]
+
+
+def test_only_rows_with_changed_key_are_read(tmp_path):
+    sheet = make_stamped_sheet(100)
+    result = make_sync(sheet, tmp_path, last_column='B', key_column='C').sync()
+    assert (result['rows'], result['rows_read']) == (100, 100)
+    sheet.edit(10, ['8', '-9.8'])
+    sheet.edit(50, ['48', '-9.48'])
+    sheet.edit(102, ['100', '-7.100'])
+    cells_read = sheet.cells_read
+    result = make_sync(sheet, tmp_path, last_column='B', key_column='C').sync()
+    assert (result['rows'], result['rows_read'], result['new_rows'], result['changed_rows']) == (101, 3, 1, 3)
+    # header, first and key columns, then 3 rows
+    assert sheet.cells_read - cells_read == 2 + 2 * 101 + 2 * 3
+    assert read_csv(tmp_path / 'mirror.csv') == mirror_rows(sheet)
+
+
+def test_deleted_rows_are_picked_up_with_key_column(tmp_path):
+    sheet = make_stamped_sheet(10)
+    make_sync(sheet, tmp_path, last_column='B', key_column='C').sync()
+    sheet.delete(5)
+    result = make_sync(sheet, tmp_path, last_column='B', key_column='C').sync()
+    # rows after the deleted one moved up, and are read again
+    assert (result['rows'], result['rows_read'], result['removed_rows']) == (9, 6, 1)
+    assert read_csv(tmp_path / 'mirror.csv') == mirror_rows(sheet)
+
+
+def test_rows_without_key_are_always_read(tmp_path):
+    sheet = make_stamped_sheet(5)
+    sheet.rows[3][2] = ''
+    make_sync(sheet, tmp_path, last_column='B', key_column='C').sync()
+    sheet.rows[3][1] = '-9.9'
+    sheet.revision += 1
+    result = make_sync(sheet, tmp_path, last_column='B', key_column='C').sync()
+    assert (result['rows_read'], result['changed_rows']) == (1, 1)
+    assert read_csv(tmp_path / 'mirror.csv') == mirror_rows(sheet)
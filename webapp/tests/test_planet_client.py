@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Tests of planet_client retries, circuit breaker, rate limiting and pagination against the local fake Planet API
+(benchmarks/fake_planet_api.py).
+
+Run from the webapp folder:
+    $ python -m pytest tests
+'''
+
+import os
+import socket
+import sys
+import time
+
+import pytest
+
+webapp_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, webapp_dir)
+sys.path.insert(0, os.path.join(webapp_dir, 'benchmarks'))
+from fake_planet_api import FakePlanetAPI, generate_scenes
+from planet_client import CircuitOpenError, PlanetAPIError, PlanetClient, TokenBucket
+
+search_request = {
+    'item_types': ['PSScene4Band'],
+    'filter': {'type': 'AndFilter', 'config': [
+        {'type': 'GeometryFilter', 'field_name': 'geometry',
+         'config': {'type': 'Polygon', 'coordinates': [[[-50.5, -6.4], [-50.4, -6.4], [-50.4, -6.3], [-50.5, -6.3], [-50.5, -6.4]]]}},
+        {'type': 'DateRangeFilter', 'field_name': 'acquired',
+         'config': {'gte': '2020-08-01T00:00:00Z', 'lte': '2020-09-30T00:00:00Z'}},
+    ]},
+}
+
+
+@pytest.fixture
+def api():
+    api = FakePlanetAPI().start()
+    yield api
+    api.stop()
+
+
+def make_client(url, **kwargs):
+    # no waiting between retries, unless a test asks for it
+    settings = dict(rate_limit=1000, rate_burst=1000, max_retries=3, backoff_base=0, backoff_max=0,
+                    breaker_threshold=3, breaker_cooldown=30)
+    settings.update(kwargs)
+    return PlanetClient('key', base_url=url, **settings)
+
+
+def first_page(client):
+    return next(client.quick_search_pages(search_request))
+
+
+def test_5xx_responses_are_retried(api):
+    client = make_client(api.url)
+    api.fail_next(503, count=2)
+    assert first_page(client)
+    assert (api.failed_requests, api.searches) == (2, 1)
+    assert client.breaker.failures == 0
+
+
+def test_429_responses_are_retried_without_opening_breaker(api):
+    client = make_client(api.url, breaker_threshold=2)
+    api.fail_next(429, count=3, retry_after=0)
+    assert first_page(client)
+    # retries exhausted on 429s fail the call, but don't open the circuit breaker
+    api.fail_next(429, count=4, retry_after=0)
+    with pytest.raises(PlanetAPIError) as error:
+        first_page(client)
+    assert not isinstance(error.value, CircuitOpenError)
+    assert client.breaker.opened_at is None
+    assert first_page(client)
+
+
+def test_retry_after_is_followed():
+    client = make_client('http://127.0.0.1', backoff_max=8)
+    assert client.backoff_delay(0, '2') == 2
+    # capped to backoff_max, and ignored if not a number of seconds
+    assert client.backoff_delay(0, '60') == 8
+    assert 0 <= client.backoff_delay(0, 'Wed, 21 Oct 2015 07:28:00 GMT') <= client.backoff_base
+
+
+def test_client_errors_are_not_retried(api):
+    client = make_client(api.url)
+    api.fail_next(400, count=2)
+    with pytest.raises(PlanetAPIError):
+        first_page(client)
+    assert api.failed_requests == 1
+    assert client.breaker.failures == 0
+
+
+def test_breaker_opens_then_recovers_half_open(api):
+    client = make_client(api.url, max_retries=0, breaker_threshold=2, breaker_cooldown=0.2)
+    api.fail_next(500, count=2)
+    for _ in range(2):
+        with pytest.raises(PlanetAPIError):
+            first_page(client)
+    # open: fails fast without calling the API
+    with pytest.raises(CircuitOpenError):
+        first_page(client)
+    assert api.failed_requests + api.searches == 2
+
+    # half-open after cooldown: a failed trial call reopens the circuit
+    time.sleep(0.25)
+    api.fail_next(500)
+    with pytest.raises(PlanetAPIError):
+        first_page(client)
+    with pytest.raises(CircuitOpenError):
+        first_page(client)
+
+    # and a successful one closes it
+    time.sleep(0.25)
+    assert first_page(client)
+    assert client.breaker.opened_at is None
+    assert first_page(client)
+
+
+def test_connection_errors_open_breaker():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    # nothing listens on port anymore
+    client = make_client('http://127.0.0.1:{}'.format(port), max_retries=1, breaker_threshold=2)
+    with pytest.raises(PlanetAPIError):
+        first_page(client)
+    with pytest.raises(CircuitOpenError):
+        first_page(client)
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=20, capacity=2)
+    start_time = time.monotonic()
+    for _ in range(2):
+        bucket.acquire()
+    assert time.monotonic() - start_time < 0.05
+    for _ in range(4):
+        bucket.acquire()
+    assert time.monotonic() - start_time >= 4 / 20. - 0.01
+
+
+def test_quick_search_pages_follow_next_links(api):
+    client = make_client(api.url)
+    pages = list(client.quick_search_pages(search_request, page_size=10))
+    features = [feature['id'] for page in pages for feature in page]
+    assert len(pages) > 2
+    assert all(len(page) == 10 for page in pages[:-1])
+    assert sorted(features) == sorted(feature['id'] for feature in generate_scenes(search_request))
+    assert api.page_requests == len(pages) - 1
+
+
+def test_quick_search_pages_are_fetched_on_demand(api):
+    client = make_client(api.url)
+    pages = client.quick_search_pages(search_request, page_size=10)
+    next(pages)
+    next(pages)
+    assert (api.searches, api.page_requests) == (1, 1)
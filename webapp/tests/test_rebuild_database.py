@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Tests of web_app.rebuild_database: an incremental rebuild must give the same store as a full build of the csv.
+
+The app is imported with settings (WEB_APP_SETTINGS) pointing its database and log file to a temporary folder, and
+with its SQLite stores disabled.
+
+Run from the webapp folder:
+    $ python -m pytest tests
+'''
+
+import atexit
+import csv
+import os
+import shutil
+import sys
+import tempfile
+
+webapp_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, webapp_dir)
+
+workdir = tempfile.mkdtemp(prefix='test_rebuild_database_')
+atexit.register(shutil.rmtree, workdir, ignore_errors=True)
+shutil.copy(os.path.join(webapp_dir, 'sample_data.csv'), os.path.join(workdir, 'alerts.csv'))
+with open(os.path.join(workdir, 'settings.cfg'), 'w') as f:
+    f.write('\n'.join([
+        'DEBUG_MODE = False',
+        'DATABASE_FILE_BASENAME = {!r}'.format(os.path.join(workdir, 'alerts')),
+        'LOGGING_FILE_NAME = {!r}'.format(os.path.join(workdir, 'flask_app.log')),
+        'WARMUP_IN_BACKGROUND = False',
+        'SEARCH_CACHE_ENABLED = False',
+        'SCENE_CATALOG_ENABLED = False',
+        'REDIRECT_TABLE_ENABLED = False',
+        '',
+    ]))
+os.environ['WEB_APP_SETTINGS'] = os.path.join(workdir, 'settings.cfg')
+os.environ.setdefault('PL_API_KEY', 'test')
+os.environ.setdefault('FLASK_SECRET_KEY', 'test')
+import web_app
+from database_store import AlertDatabase
+
+
+def write_csv(base, rows):
+    with open('{}.csv'.format(base), 'w', newline='') as f:
+        csv.writer(f, quoting=csv.QUOTE_NONNUMERIC).writerows(rows)
+
+
+def read_csv(base):
+    with open('{}.csv'.format(base), newline='') as f:
+        return list(csv.reader(f))
+
+
+def full_build(rows, tmp_path):
+    base = str(tmp_path / 'full')
+    write_csv(base, rows)
+    web_app.load_csv(base)
+    return AlertDatabase.open('{}.arrow'.format(base), web_app.database_build_params)
+
+
+def build(rows, tmp_path):
+    base = str(tmp_path / 'alerts')
+    write_csv(base, rows)
+    return base, web_app.load_database(base, force_csv=True)
+
+
+def test_rebuild_matches_full_build(tmp_path):
+    (header, *rows) = read_csv(os.path.join(workdir, 'alerts'))
+    (base, database) = build([header] + rows, tmp_path)
+
+    lat = header.index(web_app.LAT)
+    changed = list(rows[1])
+    changed[lat] = '-7.5'
+    added = ['100', '03/09/2020', '-50.1', '-6.1', '']
+    unlocated = ['101', '03/09/2020', '', '', '']
+    duplicate = [rows[0][0], '04/09/2020', '-50.2', '-6.2', '']
+    # first row moves to the end, third one is removed
+    new_rows = [changed, unlocated] + rows[3:] + [added, rows[0], duplicate]
+    write_csv(base, [header] + new_rows)
+    status = {}
+    rebuilt = web_app.rebuild_database(database, base, status)
+
+    assert (status['rows_changed'], status['rows_removed']) == (2, 2)
+    expected = full_build([header] + new_rows, tmp_path)
+    assert rebuilt.table.equals(expected.table, check_metadata=True)
+    # rows in csv order, without the unlocated row and the second row of the duplicated id
+    assert rebuilt.column(web_app.ID).tolist() == [int(row[0]) for row in [changed] + rows[3:] + [added, rows[0]]]
+
+
+def test_unchanged_csv_rebuilds_no_row(tmp_path):
+    (header, *rows) = read_csv(os.path.join(workdir, 'alerts'))
+    (base, database) = build([header] + rows, tmp_path)
+    status = {}
+    rebuilt = web_app.rebuild_database(database, base, status)
+    assert (status['rows_changed'], status['rows_removed']) == (0, 0)
+    assert rebuilt.table.equals(database.table, check_metadata=True)
+
+
+def test_new_columns_rebuild_all_rows(tmp_path):
+    (header, *rows) = read_csv(os.path.join(workdir, 'alerts'))
+    (base, database) = build([header] + rows, tmp_path)
+    new_rows = [header + ['STATUS']] + [row + ['reviewed'] for row in rows]
+    write_csv(base, new_rows)
+    status = {}
+    rebuilt = web_app.rebuild_database(database, base, status)
+    assert status['rows_changed'] == len(rows)
+    assert rebuilt.table.equals(full_build(new_rows, tmp_path).table, check_metadata=True)
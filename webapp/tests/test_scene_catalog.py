@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Tests of scene_catalog.SceneCatalog coverage records and size limits.
+
+Run from the webapp folder:
+    $ python -m pytest tests
+'''
+
+import os
+import sys
+
+import shapely
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scene_catalog import SceneCatalog
+
+
+def make_feature(scene_id, acquired):
+    return {'id': scene_id, 'geometry': {'type': 'Polygon', 'coordinates': [[[-1, -1], [1, -1], [1, 1], [-1, 1], [-1, -1]]]},
+            'properties': {'acquired': acquired, 'cloud_cover': 0.1}}
+
+
+def test_covered_search_is_not_recorded_again(tmp_path):
+    catalog = SceneCatalog(str(tmp_path / 'catalog.sqlite'))
+    area = shapely.Point(0, 0).buffer(1)
+    for _ in range(5):
+        catalog.harvest(area, '2020-01-01T00:00:00Z', '2020-01-31T00:00:00Z', 0.5, [])
+    # smaller area, shorter window, lower cloud cover
+    catalog.harvest(area.buffer(-0.5), '2020-01-10T00:00:00Z', '2020-01-20T00:00:00Z', 0.2, [])
+    assert catalog.stats()['covered_areas'] == 1
+
+
+def test_overlapping_windows_of_an_area_are_merged(tmp_path):
+    catalog = SceneCatalog(str(tmp_path / 'catalog.sqlite'))
+    area = shapely.Point(0, 0).buffer(1)
+    catalog.harvest(area, '2020-01-01T00:00:00Z', '2020-01-10T00:00:00Z', 0.5, [])
+    catalog.harvest(area, '2020-01-05T00:00:00Z', '2020-01-20T00:00:00Z', 0.5, [])
+    # a larger area over a longer window replaces the ones it contains
+    catalog.harvest(shapely.Point(3, 0).buffer(1), '2020-01-01T00:00:00Z', '2020-01-20T00:00:00Z', 0.5, [])
+    assert catalog.stats()['covered_areas'] == 2
+    catalog.harvest(shapely.Point(1.5, 0).buffer(3), '2020-01-01T00:00:00Z', '2020-01-31T00:00:00Z', 0.5, [])
+    assert catalog.stats()['covered_areas'] == 1
+    assert catalog.search(area, '2020-01-02T00:00:00Z', '2020-01-30T00:00:00Z', 0.5) == ([], [])
+
+
+def test_lookup_uses_last_harvested_areas_only(tmp_path):
+    catalog = SceneCatalog(str(tmp_path / 'catalog.sqlite'), max_candidates=2)
+    area = shapely.Point(0, 0).buffer(1)
+    catalog.harvest(area, '2020-01-01T00:00:00Z', '2020-01-31T00:00:00Z', 0.5, [])
+    for x in (-0.1, 0.1):
+        catalog.harvest(shapely.Point(x, 1.5).buffer(1), '2020-01-01T00:00:00Z', '2020-01-31T00:00:00Z', 0.5, [])
+    # covered, but by an area older than the 2 areas harvested last
+    assert catalog.search(area, '2020-01-02T00:00:00Z', '2020-01-30T00:00:00Z', 0.5)[0] is None
+
+
+def test_scenes_and_areas_above_limits_are_evicted(tmp_path):
+    catalog = SceneCatalog(str(tmp_path / 'catalog.sqlite'), max_scenes=3, max_coverage=2)
+    for x in range(3):
+        catalog.harvest(shapely.Point(10 * x, 0).buffer(1), '2020-01-01T00:00:00Z', '2020-01-31T00:00:00Z', 0.5, [])
+    assert catalog.stats()['covered_areas'] == 2
+    features = [make_feature(str(day), '2020-03-0{}T00:00:00Z'.format(day)) for day in range(1, 6)]
+    catalog.harvest(shapely.Point(0, 0).buffer(1), '2020-03-03T00:00:00Z', '2020-03-31T00:00:00Z', 0.5, features)
+    assert catalog.stats()['scenes'] == 3
+    assert catalog.stats()['covered_areas'] == 1
+    # areas harvested over evicted scenes are gone
+    assert catalog.search(shapely.Point(10, 0).buffer(1), '2020-01-02T00:00:00Z', '2020-01-30T00:00:00Z', 0.5)[0] is None
+    features, uncovered = catalog.search(shapely.Point(0, 0).buffer(0.5), '2020-03-04T00:00:00Z', '2020-03-20T00:00:00Z', 0.5)
+    assert ([feature['id'] for feature in features], uncovered) == (['4', '5'], [])
@@ -6,29 +6,51 @@ from logging.handlers import TimedRotatingFileHandler
 
 import flask
 from flask import request, redirect
-from flask_debugtoolbar import DebugToolbarExtension
 
 import calendar
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
 import datetime
+import functools
+import hashlib
+import io
 import os
 import json
-import requests
-from requests.auth import HTTPBasicAuth
 import time
+import threading
 import sys
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows, where concurrent store builds aren't prevented
+    fcntl = None
 
 from dotenv import load_dotenv, find_dotenv, set_key
-import geopandas as gpd
+# geopandas, flask_debugtoolbar and profiling modules are imported on first use, to keep startup fast
+import numpy as np
 import pandas as pd
-from shapely.geometry import Point, shape
-from geopy import distance
+import pyarrow as pa
+import shapely
+from shapely.geometry import mapping, shape
+
+from alert_index import AlertIndex, IdIndex
+from database_store import AlertDatabase, DatabaseStoreError, StoreWriter, file_id
+from geometry_engine import metric_buffer, metric_buffers
+from metrics import Registry
+from planet_client import PlanetClient, SingleFlight
+from redirect_table import RedirectTable
+from scene_catalog import SceneCatalog
+from search_cache import SearchCache, make_search_key
+from search_planner import plan_search_groups
 
 # create Flask app
 app = flask.Flask(__name__)
 
 # load Flask app config from file
 app.config.from_pyfile('web_app_config.cfg')
+# settings can be overridden by a file given in WEB_APP_SETTINGS env variable (e.g. one per deployment)
+app.config.from_envvar('WEB_APP_SETTINGS', silent=True)
 running_env = app.config['RUNNING_ENV']
 debug_mode = app.config['DEBUG_MODE']
 logging_file_name = app.config['LOGGING_FILE_NAME']
@@ -37,6 +59,7 @@ logging_file_count = app.config['LOGGING_FILE_COUNT']
 logging_file_level = app.config['LOGGING_FILE_LEVEL']
 setenv_enabled = app.config['SETENV_ENABLED']
 database_file_base_name = app.config['DATABASE_FILE_BASENAME']
+ingest_chunk_size = app.config['INGEST_CHUNK_SIZE']
 redirect_delay = app.config['REDIRECT_DELAY']
 explorer_base_url=app.config['EXPLORER_BASE_URL']
 zoom_level=app.config['DEFAULT_ZOOM']
@@ -52,6 +75,27 @@ radius = app.config['DEFAULT_RADIUS']
 aoi_shape = app.config['AOI_SHAPE']
 simplification_threshold = app.config['SIMPLIFICATION_THRESHOLD']
 default_cloud_cover = app.config['MAX_CLOUD_COVER']
+search_cache_enabled = app.config['SEARCH_CACHE_ENABLED']
+search_page_size = app.config['SEARCH_PAGE_SIZE']
+search_max_pages = app.config['SEARCH_MAX_PAGES']
+search_max_scenes = app.config['SEARCH_MAX_SCENES']
+custom_aoi_cache_size = app.config['CUSTOM_AOI_CACHE_SIZE']
+search_coalescing_enabled = app.config['SEARCH_COALESCING_ENABLED']
+metrics_enabled = app.config['METRICS_ENABLED']
+profiling_enabled = app.config['PROFILING_ENABLED']
+profiling_dir = app.config['PROFILING_DIR']
+precomputed_urls_file = app.config['PRECOMPUTED_URLS_FILE']
+preload_indexes = app.config['PRELOAD_INDEXES']
+store_check_interval = app.config['STORE_CHECK_INTERVAL']
+warmup_in_background = app.config['WARMUP_IN_BACKGROUND']
+warmup_retry_after = app.config['WARMUP_RETRY_AFTER']
+alerts_query_default_limit = app.config['ALERTS_QUERY_DEFAULT_LIMIT']
+alerts_query_max_limit = app.config['ALERTS_QUERY_MAX_LIMIT']
+notices_max_ids = app.config['NOTICES_MAX_IDS']
+batch_max_group_size = app.config['BATCH_MAX_GROUP_SIZE']
+batch_max_group_extent = app.config['BATCH_MAX_GROUP_EXTENT']
+batch_max_window_days = app.config['BATCH_MAX_WINDOW_DAYS']
+batch_search_max_scenes = app.config['BATCH_SEARCH_MAX_SCENES']
 
 # load required env vars, hopefully set in .env file
 load_dotenv()
@@ -67,7 +111,9 @@ app.config['SECRET_KEY'] = SECRET_KEY
 
 # debug toolbar will only appear when Debug = True (needs to be after SECRET_KEY and DEBUG are set)
 app.debug = debug_mode
-toolbar = DebugToolbarExtension(app)
+if debug_mode:
+    from flask_debugtoolbar import DebugToolbarExtension
+    toolbar = DebugToolbarExtension(app)
 
 # configure logging according to settings defined in config file
 formatter = logging.Formatter(
@@ -76,6 +122,137 @@ handler = TimedRotatingFileHandler(logging_file_name, when='midnight', backupCou
 app.logger.setLevel(logging_file_level)
 handler.setFormatter(formatter)
 app.logger.addHandler(handler)
+logging.getLogger('planet_client').setLevel(logging_file_level)
+logging.getLogger('planet_client').addHandler(handler)
+
+# metrics exposed on /metrics (Prometheus text format)
+metrics_registry = Registry()
+notice_requests = metrics_registry.counter(
+    'notice_requests_total', 'Requests to /api/v1/notice, by outcome', ['outcome'])
+notice_stage_duration = metrics_registry.histogram(
+    'notice_stage_duration_seconds', 'Duration of /api/v1/notice processing stages', ['stage'])
+planet_api_responses = metrics_registry.counter(
+    'planet_api_responses_total', 'Planet API responses, by method and status code', ['method', 'status'])
+planet_api_duration = metrics_registry.histogram(
+    'planet_api_request_duration_seconds', 'Duration of Planet API calls (each retry counted separately)', ['method'])
+search_scenes = metrics_registry.histogram(
+    'search_scenes', 'Scenes per search, harvested from quick-search or kept by filters', ['kind'],
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500))
+search_pages = metrics_registry.histogram(
+    'search_pages', 'Quick-search result pages used per search', buckets=(1, 2, 3, 5, 10, 20))
+search_cache_requests = metrics_registry.counter(
+    'search_cache_requests_total', 'Search cache lookups, by result', ['result'])
+scene_catalog_requests = metrics_registry.counter(
+    'scene_catalog_requests_total', 'Scene catalog lookups, by result (hit, partial or miss)', ['result'])
+redirect_table_requests = metrics_registry.counter(
+    'redirect_table_requests_total', 'Redirect table lookups of default parameters URLs, by result (fresh, stale or miss)', ['result'])
+redirect_table_refreshes = metrics_registry.counter(
+    'redirect_table_refreshes_total', 'Background refreshes of stale redirect table entries, by outcome', ['outcome'])
+database_build_stage_duration = metrics_registry.histogram(
+    'database_build_stage_duration_seconds', 'Duration of database build stages (see load_csv)', ['stage'],
+    buckets=(0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900))
+database_load_duration = metrics_registry.histogram(
+    'database_load_duration_seconds', 'Duration of load_database, by source', ['source'],
+    buckets=(0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900))
+alerts_query_duration = metrics_registry.histogram(
+    'alerts_query_duration_seconds', 'Duration of /api/v1/alerts index lookups (results streaming excluded)')
+# read when metrics are rendered
+metrics_registry.gauge('database_rows', 'Rows in current database', lambda: len(db_snapshot.database) if db_snapshot else 0)
+metrics_registry.gauge('database_ready', '1 once the database is loaded and requests can be served', lambda: int(database_ready.is_set()))
+metrics_registry.gauge('warmup_duration_seconds', 'Duration of database warm-up at start', lambda: warmup_status['duration'] or 0)
+metrics_registry.gauge('custom_aoi_cache_hits', 'Custom AOI cache hits since start', lambda: get_custom_aoi.cache_info().hits)
+metrics_registry.gauge('custom_aoi_cache_misses', 'Custom AOI cache misses since start', lambda: get_custom_aoi.cache_info().misses)
+metrics_registry.gauge('search_coalesced_requests', 'Searches that shared a concurrent identical search since start',
+                       lambda: search_flight.coalesced if search_flight else 0)
+
+def record_planet_response(method, status, duration):
+    planet_api_responses.inc(method=method, status=status)
+    planet_api_duration.observe(duration, method=method)
+
+# Planet API client, shared by all requests to reuse connections
+planet_client = PlanetClient(PLANET_API_KEY,
+                             base_url=app.config['PLANET_API_URL'],
+                             connect_timeout=app.config['PLANET_API_CONNECT_TIMEOUT'],
+                             read_timeout=app.config['PLANET_API_READ_TIMEOUT'],
+                             pool_size=app.config['PLANET_API_POOL_SIZE'],
+                             # the quota is shared by worker processes, each has its own client
+                             rate_limit=app.config['PLANET_API_RATE_LIMIT'] / app.config['PLANET_API_PROCESSES'],
+                             rate_burst=max(app.config['PLANET_API_RATE_BURST'] // app.config['PLANET_API_PROCESSES'], 1),
+                             max_retries=app.config['PLANET_API_MAX_RETRIES'],
+                             backoff_base=app.config['PLANET_API_BACKOFF_BASE'],
+                             backoff_max=app.config['PLANET_API_BACKOFF_MAX'],
+                             breaker_threshold=app.config['PLANET_API_BREAKER_THRESHOLD'],
+                             breaker_cooldown=app.config['PLANET_API_BREAKER_COOLDOWN'],
+                             on_response=record_planet_response)
+
+# coalescing of concurrent identical searches
+search_flight = SingleFlight() if search_coalescing_enabled else None
+
+# parameters used to build the database, store file is rebuilt from CSV when they change
+database_build_params = {
+    'lat': LAT,
+    'long': LONG,
+    'id': ID,
+    'reference_date': REFERENCE_DATE,
+    'reference_date_format': REFERENCE_DATE_FORMAT,
+    'days_before': days_before_date,
+    'days_after': days_after_date,
+    'radius': radius,
+    'aoi_shape': aoi_shape,
+    'simplification_threshold': simplification_threshold,
+    'geometry_engine': 'metric',
+    # rows with an already seen id are dropped (see ingest_alerts)
+    'unique_ids': True,
+}
+
+# Planet quick-search results cache
+if search_cache_enabled:
+    search_cache = SearchCache(app.config['SEARCH_CACHE_FILE'],
+                               max_entries=app.config['SEARCH_CACHE_MAX_ENTRIES'],
+                               past_ttl=app.config['SEARCH_CACHE_PAST_TTL'],
+                               recent_ttl=app.config['SEARCH_CACHE_RECENT_TTL'],
+                               settle_days=app.config['SEARCH_CACHE_SETTLE_DAYS'])
+else:
+    search_cache = None
+
+# local catalog of harvested scenes, answering searches over already harvested areas and windows
+if app.config['SCENE_CATALOG_ENABLED']:
+    scene_catalog = SceneCatalog(app.config['SCENE_CATALOG_FILE'],
+                                 settle_days=app.config['SCENE_CATALOG_SETTLE_DAYS'],
+                                 max_scenes=app.config['SCENE_CATALOG_MAX_SCENES'],
+                                 max_coverage=app.config['SCENE_CATALOG_MAX_COVERAGE'],
+                                 max_candidates=app.config['SCENE_CATALOG_MAX_CANDIDATES'])
+else:
+    scene_catalog = None
+
+# default parameters URLs, served from a table and refreshed in the background once stale
+if app.config['REDIRECT_TABLE_ENABLED']:
+    redirect_table = RedirectTable(app.config['REDIRECT_TABLE_FILE'], max_age=app.config['REDIRECT_TABLE_MAX_AGE'])
+    redirect_refresh_executor = ThreadPoolExecutor(max_workers=app.config['REDIRECT_TABLE_REFRESH_WORKERS'],
+                                                   thread_name_prefix='redirect-refresh')
+else:
+    redirect_table = None
+# ids whose refresh is queued or running, so that a popular stale id is only refreshed once
+redirect_refreshing = set()
+redirect_refreshing_lock = threading.Lock()
+
+# database and its id and spatio-temporal indexes, replaced as a whole by set_database()
+DatabaseSnapshot = namedtuple('DatabaseSnapshot', ['database', 'id_index', 'alert_index'])
+PrecomputedUrls = namedtuple('PrecomputedUrls', ['id_index', 'urls'])
+
+# background database rebuild state, reported by /rebuild/status
+rebuild_lock = threading.Lock()
+rebuild_status = {'state': 'idle'}
+
+# database warm-up at start (see warm_up), reported by /health/ready
+db_snapshot = None
+precomputed_urls = None
+database_ready = threading.Event()
+warmup_done = threading.Event()
+warmup_status = {'state': 'pending', 'duration': None, 'error': None}
+# store file replacement checks (see reload_replaced_store)
+store_check = {'checked_at': 0.}
+store_reload_lock = threading.Lock()
 
 # Global variables
 seconds_per_day = 86400                                                 # used by create_times
@@ -112,27 +289,58 @@ def get_time_from_id(image_id):
     time_in_ms = calendar.timegm(date.timetuple()) * 1000
     return time_in_ms
 
-def one_degree_lat_as_meters(lat=0.0):
-    # take 2 points 0.5° higher/lower than reference, compute distance in meters using best method in GeoPy (currently geodetic)
-    point1 = (0.0, lat + 0.5)
-    point2 = (0.0, lat - 0.5)
-    return distance.distance(point1, point2).m
+def create_times_array(dates, days_before=days_before_date, days_after=days_after_date):
+    '''
+    Columnar version of create_times: takes in a datetime Series and returns a list of
+    (x days before, y days after, iso before, iso after) tuples, identical to create_times output.
+    '''
+    view_dates = dates.values.astype('datetime64[ms]').astype(np.int64)
+    before_dates = view_dates - (millisecs_per_day * days_before)
+    after_dates = view_dates + (millisecs_per_day * days_after)
+
+    iso_before_dates = np.char.add(np.datetime_as_string(before_dates.astype('datetime64[ms]'), unit='s'), 'Z')
+    iso_after_dates = np.char.add(np.datetime_as_string(after_dates.astype('datetime64[ms]'), unit='s'), 'Z')
+    # isoformat() only shows sub-second digits when present, fall back to it for those (rare) dates
+    for iso_dates, unix_dates in ((iso_before_dates, before_dates), (iso_after_dates, after_dates)):
+        for i in np.flatnonzero(unix_dates % 1000):
+            iso_dates[i] = datetime.datetime.utcfromtimestamp(unix_dates[i]/1000).isoformat()+'Z'
 
-def create_buffer(row, shape='circle'):
+    return list(zip((before_dates + millisecs_per_day).tolist(), (after_dates - millisecs_per_day).tolist(),
+                    iso_before_dates.tolist(), iso_after_dates.tolist()))
+
+def create_buffers(gdf, shape='circle'):
     '''
-    Takes in a geodataframe row, and returns the row with a new geometry (radius-based 'circle' or 'square' around row['geometry']).
+    Takes in a point geodataframe, and returns a GeoSeries of radius-based 'circle' or 'square' geometries
+    around each point, with true metric dimensions (see geometry_engine.metric_buffers).
     '''
-    deg_to_meters = one_degree_lat_as_meters(lat=row[LAT])                          
-    radius_in_deg = radius/float(deg_to_meters)             
-    point = row["geometry"]
-    if shape=='circle':
-        row["geometry"] = point.buffer(radius_in_deg)
-    elif shape=='square':
-        row["geometry"] = point.buffer(radius_in_deg).envelope
-    else:
-        logging.warning('Invalid {} shape value'.format(shape))
-        row["geometry"] = None
-    return row
+    import geopandas as gpd
+    return gpd.GeoSeries(metric_buffers(gdf[LONG].values, gdf[LAT].values, radius, shape), index=gdf.index, crs='epsg:4326')
+
+@functools.lru_cache(maxsize=custom_aoi_cache_size)
+def get_custom_aoi(lng, lat, custom_radius, custom_shape):
+    '''
+    Takes in point coordinates, a radius in meters and a shape, and returns a (geometry, simplified wkt) tuple.
+    Memoized, so that repeated custom radius/shape requests on an alert don't recompute geometry.
+    '''
+    geometry = metric_buffer(lng, lat, custom_radius, custom_shape)
+    return geometry, geometry.simplify(simplification_threshold).wkt.replace(' ','')
+
+def has_polygon_aoi(row):
+    '''
+    Takes in a database row, and returns whether its AOI is a source alert polygon (see polygon_aois) rather than
+    the default radius buffer around its location.
+    '''
+    default_aoi = metric_buffer(row[LONG], row[LAT], radius, aoi_shape)
+    return not shapely.equals_exact(row['geometry'], default_aoi, tolerance=1e-9)
+
+def log_stage_rate(stage, start_time, row_count):
+    '''
+    Logs duration and throughput (rows/sec) of a database build stage started at start_time.
+    '''
+    elapsed = time.perf_counter() - start_time
+    database_build_stage_duration.observe(elapsed, stage=stage)
+    rate = row_count/elapsed if elapsed > 0 else float('inf')
+    app.logger.info('{} - done in {:.3f}s ({:.0f} rows/sec)'.format(stage, elapsed, rate))
 
 def get_coord_list(geo_row):
     '''
@@ -148,10 +356,29 @@ def get_coord_list(geo_row):
         final_coords.append([float(num) for num in sublist])
     return final_coords
 
+def get_search_coord_list(aoi):
+    '''
+    Takes in an AOI geometry, and returns the coordinate list of its simplified version (the one of the wkt column)
+    to search scenes with, so that search requests and their cache keys don't grow with source polygon vertices.
+    '''
+    return get_coord_list(aoi.simplify(simplification_threshold))
+
 def get_image_ids(coord_list, earlier_time, later_time, max_cloud_cover=default_cloud_cover):
 
     json_geometry = {'type': 'Polygon', 'coordinates': [coord_list]}
+    search_request = make_search_request(json_geometry, earlier_time, later_time, max_cloud_cover)
 
+    cache_key = make_search_key(coord_list, earlier_time, later_time, max_cloud_cover, search_request['item_types'][0])
+    search = functools.partial(run_search, search_request, cache_key, shape(json_geometry), earlier_time, later_time, max_cloud_cover)
+    # concurrent identical searches (e.g. an alert link shared with a whole team) share a single upstream search
+    image_ids = search_flight.do(cache_key, search) if search_flight else search()
+    return list(image_ids)
+
+def make_search_request(json_geometry, earlier_time, later_time, max_cloud_cover=default_cloud_cover):
+    '''
+    Takes in a GeoJSON geometry, ISO start/end times and max cloud cover (%), and returns a quick-search request
+    for finalized PSScene4Band scenes.
+    '''
     geometry_filter = {
       "type": "GeometryFilter",
       "field_name": "geometry",
@@ -200,25 +427,157 @@ def get_image_ids(coord_list, earlier_time, later_time, max_cloud_cover=default_
       "item_types": [item_type],
       "filter": combined_filter
     }
+    return search_request
 
-    # fire off the POST request
-    search_result = \
-      requests.post(
-        'https://api.planet.com/data/v1/quick-search',
-        auth=HTTPBasicAuth(PLANET_API_KEY, ''),
-        json=search_request)
+def run_search(search_request, cache_key, aoi, earlier_time, later_time, max_cloud_cover=default_cloud_cover):
+    '''
+    Runs quick-search request (or reuses cached features of an identical one), and returns sorted ids of
+    scenes passing the AOI intersection and cloud cover filters.
+    Used by get_image_ids.
+    '''
+    # reuse features from a previous identical search if available, else stream result pages from quick-search
+    start_time = time.perf_counter()
+    features = search_cache.get(cache_key) if search_cache else None
+    if search_cache:
+        notice_stage_duration.observe(time.perf_counter() - start_time, stage='search_cache')
+        search_cache_requests.inc(result='miss' if features is None else 'hit')
+        if features is not None:
+            app.logger.info('Search cache hit')
+    from_upstream = features is None
+    if from_upstream and scene_catalog:
+        start_time = time.perf_counter()
+        features = search_catalog(aoi, earlier_time, later_time, max_cloud_cover)
+        notice_stage_duration.observe(time.perf_counter() - start_time, stage='scene_catalog')
+        from_upstream = features is None
+    if from_upstream:
+        # raises PlanetAPIError if no valid response could be obtained
+        pages = planet_client.quick_search_pages(search_request, page_size=search_page_size)
+    else:
+        pages = [features]
 
-    image_ids = [feature['id'] for feature in search_result.json()['features']]
+    # filter pages as they arrive, and stop fetching as soon as scenes were found on both first and last
+    # possible days of the window: earliest and latest comparison dates can't change anymore
+    first_day, last_day = get_window_days(earlier_time, later_time)
+    harvested_features = []
+    filtered_ids = []
+    page_number = 0
+    # whether all result pages were read, i.e. whether harvested features are all the scenes matching the search
+    complete = True
+    start_time = time.perf_counter()
+    for page_number, page in enumerate(pages, 1):
+        filter_start_time = time.perf_counter()
+        notice_stage_duration.observe(filter_start_time - start_time, stage='search_page')
+        harvested_features.extend(page)
+        filtered_ids.extend(filter_features(aoi, page, max_cloud_cover))
+        start_time = time.perf_counter()
+        notice_stage_duration.observe(start_time - filter_start_time, stage='filter')
+        if filtered_ids and min(filtered_ids)[:8] <= first_day and max(filtered_ids)[:8] >= last_day:
+            complete = len(page) < search_page_size
+            break
+        if page_number >= search_max_pages or len(harvested_features) >= search_max_scenes:
+            app.logger.info('Search stopped after {} pages, {} scenes'.format(page_number, len(harvested_features)))
+            complete = len(page) < search_page_size
+            break
 
-    # filter by % of interesection with AOI
-    aoi = shape(json_geometry)
-    ratio = [aoi.intersection(shape(feature['geometry'])).area/aoi.area for feature in search_result.json()['features']]
-    filtered_ids = [i for (i, v) in zip(image_ids, ratio) if v >= intersection_filter/100]
+    search_pages.observe(page_number)
+    search_scenes.observe(len(harvested_features), kind='harvested')
+    search_scenes.observe(len(filtered_ids), kind='filtered')
 
-    app.logger.info(search_result.status_code)
+    if from_upstream and search_cache:
+        search_cache.set(cache_key, harvested_features, later_time)
+    if from_upstream and scene_catalog:
+        scene_catalog.harvest(aoi, earlier_time, later_time, max_cloud_cover/100., harvested_features, complete)
 
     return sorted(filtered_ids, reverse=True)
 
+def fetch_all_features(search_request, max_pages=search_max_pages, max_scenes=search_max_scenes):
+    '''
+    Takes in a quick-search request, and returns a (features, complete) tuple: features of all result pages, up to
+    max_pages pages (if not None) and max_scenes scenes, and whether all result pages were read.
+    '''
+    features = []
+    for (page_number, page) in enumerate(planet_client.quick_search_pages(search_request, page_size=search_page_size), 1):
+        features.extend(page)
+        if len(page) == search_page_size and ((max_pages and page_number >= max_pages) or len(features) >= max_scenes):
+            return features, False
+    return features, True
+
+def search_catalog(aoi, earlier_time, later_time, max_cloud_cover=default_cloud_cover):
+    '''
+    Takes in a search AOI (shapely geometry), ISO start/end times and max cloud cover (%), and returns features
+    of the scene catalog matching the search, or None if no part of the window was harvested over aoi yet.
+    Parts of the window which weren't harvested are searched upstream (over aoi) and harvested first.
+    '''
+    features, uncovered_ranges = scene_catalog.search(aoi, earlier_time, later_time, max_cloud_cover/100.)
+    if features is None:
+        scene_catalog_requests.inc(result='miss')
+        return None
+    scene_catalog_requests.inc(result='partial' if uncovered_ranges else 'hit')
+    app.logger.info('Scene catalog hit, {} uncovered ranges'.format(len(uncovered_ranges)))
+    features = {feature['id']: feature for feature in features}
+    for (range_start, range_end) in uncovered_ranges:
+        range_features, complete = fetch_all_features(make_search_request(mapping(aoi), range_start, range_end, max_cloud_cover))
+        scene_catalog.harvest(aoi, range_start, range_end, max_cloud_cover/100., range_features, complete)
+        features.update((feature['id'], feature) for feature in range_features)
+    return list(features.values())
+
+def get_window_days(earlier_time, later_time):
+    '''
+    Takes in ISO start/end times of a search window, and returns first and last days (as YYYYMMDD, like
+    image ids prefixes) on which a scene can be acquired.
+    '''
+    earlier_date = datetime.datetime.fromisoformat(earlier_time.replace('Z', ''))
+    # window end is inclusive, but a scene acquired exactly at midnight is very unlikely
+    later_date = datetime.datetime.fromisoformat(later_time.replace('Z', '')) - datetime.timedelta(microseconds=1)
+    return earlier_date.strftime('%Y%m%d'), later_date.strftime('%Y%m%d')
+
+def parse_footprints(geometries):
+    '''
+    Takes in a list of GeoJSON geometries, and returns them as a shapely geometry array.
+    Single ring polygons (i.e. Planet scene footprints) are built in bulk from their coordinates.
+    '''
+    if all(geometry['type'] == 'Polygon' and len(geometry['coordinates']) == 1 for geometry in geometries):
+        rings = [geometry['coordinates'][0] for geometry in geometries]
+        ring_lengths = np.fromiter((len(ring) for ring in rings), dtype=np.int64, count=len(rings))
+        coords = np.array([point[:2] for ring in rings for point in ring], dtype=float).reshape(-1, 2)
+        ring_indices = np.repeat(np.arange(len(rings)), ring_lengths)
+        return shapely.polygons(shapely.linearrings(coords, indices=ring_indices))
+    footprints = np.empty(len(geometries), dtype=object)
+    footprints[:] = [shape(geometry) for geometry in geometries]
+    return footprints
+
+def filter_features(aoi, features, max_cloud_cover=default_cloud_cover):
+    '''
+    Takes in an AOI geometry and a list of quick-search features, and returns ids of features whose footprint
+    covers at least INTERSECTION_FILTER % of the AOI and whose cloud cover is below max_cloud_cover %.
+    '''
+    features = [feature for feature in features
+                if feature.get('properties', {}).get('cloud_cover', 0) <= max_cloud_cover/100.]
+    if not features:
+        return []
+    image_ids = np.array([feature['id'] for feature in features], dtype=object)
+    footprints = parse_footprints([feature['geometry'] for feature in features])
+    return filter_footprints(aoi, image_ids, footprints)
+
+def filter_footprints(aoi, image_ids, footprints):
+    '''
+    Takes in an AOI geometry, and arrays of scene ids and footprints (shapely geometries), and returns ids of scenes
+    whose footprint covers at least INTERSECTION_FILTER % of the AOI.
+    '''
+    min_ratio = intersection_filter/100
+
+    # bounding box prefilter: AOI/footprint intersection can't be larger than their bounding boxes intersection
+    aoi_minx, aoi_miny, aoi_maxx, aoi_maxy = aoi.bounds
+    bounds = shapely.bounds(footprints)
+    bbox_overlap = (np.clip(np.minimum(bounds[:, 2], aoi_maxx) - np.maximum(bounds[:, 0], aoi_minx), 0, None)
+                    * np.clip(np.minimum(bounds[:, 3], aoi_maxy) - np.maximum(bounds[:, 1], aoi_miny), 0, None))
+    candidates = bbox_overlap/aoi.area >= min_ratio - 1e-9
+
+    # filter by % of interesection with AOI (exact computation, only on remaining candidates)
+    ratio = np.zeros(len(image_ids))
+    ratio[candidates] = shapely.area(shapely.intersection(aoi, footprints[candidates]))/aoi.area
+    return image_ids[ratio >= min_ratio].tolist()
+
 def get_bands_string(image_ids):
     strings = []
     for s in image_ids:
@@ -228,13 +587,22 @@ def get_bands_string(image_ids):
     return scenes
 
 def compute_url(row, max_cloud_cover=default_cloud_cover):
+    date_left = row['UNIX_TIMES'][2]
+    date_right = row['UNIX_TIMES'][3]
+    with notice_stage_duration.time(stage='search'):
+        image_ids = get_image_ids(get_search_coord_list(row['geometry']), date_left, date_right, max_cloud_cover=max_cloud_cover)
+    return format_url(row, image_ids)
+
+def format_url(row, image_ids):
+    '''
+    Takes in a row and ids of its scenes (sorted by decreasing acquisition date), and returns its Planet Explorer URL,
+    or None if there is no scene.
+    '''
+    start_time = time.perf_counter()
     lng_s = "{}".format(row[LONG])
     lat_s = "{}".format(row[LAT])
-    scene_date_left = row['UNIX_TIMES'][0]
-    scene_date_right = row['UNIX_TIMES'][1]
     date_left = row['UNIX_TIMES'][2]
     date_right = row['UNIX_TIMES'][3]
-    image_ids = get_image_ids(get_coord_list(row['geometry']), date_left, date_right, max_cloud_cover=max_cloud_cover)
     if len(image_ids):
         id_date_left = get_time_from_id(image_ids[-1])
         id_date_right = get_time_from_id(image_ids[0])
@@ -243,55 +611,590 @@ def compute_url(row, max_cloud_cover=default_cloud_cover):
                                 explorer_base_url,lng_s,lat_s,zoom_level,date_left,date_right,row['wkt'],band_strings,id_date_left,id_date_right)
     else:
         base_url = None
+    notice_stage_duration.observe(time.perf_counter() - start_time, stage='format_url')
     return base_url
 
+def get_redirect_versions(lngs, lats, wkts, earlier_times, later_times):
+    '''
+    Takes in lists of row coordinates, AOI wkts and ISO start/end times, and returns hashes of all inputs of their
+    default parameters URL (along with URL settings), used as redirect table entries versions.
+    '''
+    settings = '{}|{}|{}|{}'.format(default_cloud_cover, intersection_filter, zoom_level, explorer_base_url)
+    return [hashlib.sha1('{}|{}|{}|{}|{}|{}'.format(lng, lat, wkt, earlier_time, later_time, settings).encode('utf-8')).hexdigest()
+            for (lng, lat, wkt, earlier_time, later_time) in zip(lngs, lats, wkts, earlier_times, later_times)]
+
+def get_redirect_version(row):
+    return get_redirect_versions([row[LONG]], [row[LAT]], [row['wkt']], [row['UNIX_TIMES'][2]], [row['UNIX_TIMES'][3]])[0]
+
+def get_default_url(uid, row):
+    '''
+    Takes in an id and its (unmodified) database row, and returns its default parameters URL from the redirect
+    table, without any upstream call. Stale entries are served as is and refreshed in the background, missing
+    ones (e.g. new or changed rows) are computed and stored.
+    '''
+    version = get_redirect_version(row)
+    entry = redirect_table.get(uid, version)
+    if entry is None:
+        redirect_table_requests.inc(result='miss')
+        base_url = compute_url(row)
+        redirect_table.set(uid, version, base_url)
+        return base_url
+    base_url, stale = entry
+    redirect_table_requests.inc(result='stale' if stale else 'fresh')
+    if stale:
+        with redirect_refreshing_lock:
+            refresh = uid not in redirect_refreshing
+            redirect_refreshing.add(uid)
+        if refresh:
+            redirect_refresh_executor.submit(refresh_redirect, uid)
+    return base_url or None
+
+def refresh_redirect(uid):
+    '''
+    Recomputes the default parameters URL of uid and stores it in the redirect table. Run in background threads.
+    '''
+    try:
+        row = get_row(uid)
+        redirect_table.set(uid, get_redirect_version(row), compute_url(row))
+        redirect_table_refreshes.inc(outcome='done')
+    except Exception as e:
+        app.logger.warning('Refresh of redirect table entry {} failed: {}'.format(uid, e))
+        redirect_table_refreshes.inc(outcome='error')
+    finally:
+        with redirect_refreshing_lock:
+            redirect_refreshing.discard(uid)
+
+def seed_redirect_table(database, urls):
+    '''
+    Takes in an AlertDatabase and a dict of {id: default parameters URL} of its rows (e.g. computed by
+    precompute_urls.py), and stores them in the redirect table.
+    '''
+    uids = database.column(ID)
+    positions = np.flatnonzero(pd.Series(uids).isin(urls).values & ~pd.Series(uids).duplicated().values)
+    versions = get_redirect_versions(database.column(LONG)[positions].tolist(), database.column(LAT)[positions].tolist(),
+                                     database.column('wkt')[positions].tolist(),
+                                     database.column('UNIX_TIMES_ISO_BEFORE')[positions].tolist(),
+                                     database.column('UNIX_TIMES_ISO_AFTER')[positions].tolist())
+    redirect_table.set_many([(uid, version, urls[uid]) for (uid, version) in zip(uids[positions].tolist(), versions)])
+    app.logger.info('Redirect table seeded with {} URLs'.format(len(versions)))
+
+def plan_batches(database):
+    '''
+    Takes in an AlertDatabase, and returns a list of groups (arrays of row positions) of rows whose default AOIs and
+    date windows overlap, to be searched at once by search_group (see search_planner.plan_search_groups).
+    '''
+    bounds = shapely.bounds(shapely.from_wkb(database.column('geometry')))
+    # UNIX_TIMES windows are one day narrower than the ISO ones on each side, which doesn't change overlaps
+    return plan_search_groups(bounds, database.column('UNIX_TIMES_BEFORE'), database.column('UNIX_TIMES_AFTER'),
+                              max_group_size=batch_max_group_size, max_extent=batch_max_group_extent,
+                              max_window=batch_max_window_days * millisecs_per_day)
+
+def search_group(rows, max_cloud_cover=default_cloud_cover):
+    '''
+    Takes in a geodataframe of rows (e.g. a group planned by plan_batches), and returns a list of their sorted scene ids,
+    like get_image_ids would for each row. A single quick-search is run over the convex hull of the rows AOIs and their
+    widest date window, then each row AOI, date window and cloud cover filters are applied locally.
+    '''
+    if len(rows) == 1:
+        row = rows.iloc[0]
+        return [get_image_ids(get_search_coord_list(row['geometry']), row['UNIX_TIMES'][2], row['UNIX_TIMES'][3], max_cloud_cover)]
+    # hull is buffered by the simplification tolerance first, so that the simplified area still contains all AOIs
+    area = shapely.convex_hull(shapely.union_all(rows.geometry.values)).buffer(simplification_threshold).simplify(simplification_threshold)
+    earlier_time = min(unix_times[2] for unix_times in rows['UNIX_TIMES'])
+    later_time = max(unix_times[3] for unix_times in rows['UNIX_TIMES'])
+    coord_list = [list(point) for point in area.exterior.coords]
+    search_request = make_search_request({'type': 'Polygon', 'coordinates': [coord_list]}, earlier_time, later_time, max_cloud_cover)
+
+    cache_key = make_search_key(coord_list, earlier_time, later_time, max_cloud_cover, search_request['item_types'][0])
+    features = search_cache.get(cache_key) if search_cache else None
+    if features is None and scene_catalog:
+        features = search_catalog(area, earlier_time, later_time, max_cloud_cover)
+    if features is None:
+        features, complete = fetch_all_features(search_request, max_pages=None, max_scenes=batch_search_max_scenes)
+        if not complete:
+            # some rows may be missing scenes, search them one by one instead
+            app.logger.warning('Group search of {} rows stopped at {} scenes, searching rows one by one'.format(len(rows), len(features)))
+            return [search_group(rows.iloc[[i]], max_cloud_cover)[0] for i in range(len(rows))]
+        if search_cache:
+            search_cache.set(cache_key, features, later_time)
+        if scene_catalog:
+            scene_catalog.harvest(area, earlier_time, later_time, max_cloud_cover/100., features)
+
+    # footprints are parsed once for the whole group
+    features = [feature for feature in features
+                if feature.get('properties', {}).get('cloud_cover', 0) <= max_cloud_cover/100.]
+    if not features:
+        return [[] for _ in range(len(rows))]
+    scene_ids = np.array([feature['id'] for feature in features], dtype=object)
+    footprints = parse_footprints([feature['geometry'] for feature in features])
+    acquired = np.array([feature['properties']['acquired'].rstrip('Z') for feature in features], dtype='datetime64[us]')
+    image_ids = []
+    for (aoi, unix_times) in zip(rows.geometry.values, rows['UNIX_TIMES']):
+        in_window = (acquired >= np.datetime64(unix_times[2].rstrip('Z'))) & (acquired <= np.datetime64(unix_times[3].rstrip('Z')))
+        image_ids.append(sorted(filter_footprints(aoi, scene_ids[in_window], footprints[in_window]), reverse=True))
+    return image_ids
+
+def compute_group_urls(rows, max_cloud_cover=default_cloud_cover):
+    '''
+    Batch version of compute_url: takes in a geodataframe of rows, and returns the list of their Planet Explorer URLs
+    (see search_group).
+    '''
+    return [format_url(rows.iloc[i], image_ids) for (i, image_ids) in enumerate(search_group(rows, max_cloud_cover))]
+
 def load_database(input_file=database_file_base_name, force_csv=False):
     '''
-    Takes in base filename, and returns a geodataframe after either
-    - loading a cached pickle version
+    Takes in base filename, and returns an AlertDatabase after either
+    - memory-mapping an existing Arrow store file, built with current store version and parameters
     - or building a new one from a csv file.
     '''
-    if force_csv:
-        gdf = load_csv(database_file_base_name)
-    else:
+    store_file = '{}.arrow'.format(os.path.join(input_file))
+    start_time = time.perf_counter()
+    if not force_csv:
         try:
-            gdf = pd.read_pickle('{}.pkl'.format(os.path.join(database_file_base_name)))
-            app.logger.info('Found existing pickle, using it instead of CSV')
+            database = AlertDatabase.open(store_file, database_build_params)
+            app.logger.info('Found existing store {}, using it instead of CSV'.format(store_file))
+            database_load_duration.observe(time.perf_counter() - start_time, source='store')
+            return database
+        except DatabaseStoreError as e:
+            app.logger.info('Building database from CSV: {}'.format(e))
         except Exception as e:
-            gdf = load_csv(database_file_base_name)
-    return gdf
+            app.logger.warning('Building database from CSV, unable to read {}: {}'.format(store_file, e))
+    # worker processes of a multi-process server all start at once, only one of them builds the store
+    # (the others wait for it on the build lock, then open the store)
+    with store_build_lock(input_file):
+        if fcntl and not force_csv:
+            try:
+                database = AlertDatabase.open(store_file, database_build_params)
+                app.logger.info('Store {} was built by another process meanwhile, using it'.format(store_file))
+                database_load_duration.observe(time.perf_counter() - start_time, source='store')
+                return database
+            except Exception:
+                pass
+        load_csv(input_file)
+    database = AlertDatabase.open(store_file, database_build_params)
+    database_load_duration.observe(time.perf_counter() - start_time, source='csv')
+    return database
+
+@contextlib.contextmanager
+def store_build_lock(input_file=database_file_base_name):
+    '''
+    Context manager holding an exclusive lock on the csv file of base filename input_file, so that a single process
+    (e.g. worker of a multi-process server) builds or rebuilds its store at a time.
+    '''
+    with open('{}.csv'.format(os.path.join(input_file))) as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
 
 def load_csv(input_file=database_file_base_name):
     '''
-    Takes in base filename, and returns a geodataframe after building a new one from a csv file.
-    Used by load_database() when pickle file is not found or rebuilt
+    Takes in base filename, builds the database store from its csv file (chunk by chunk, see ingest_alerts),
+    and returns the number of rows. Used by load_database() when store file is not found or rebuilt
+    '''
+    return ingest_alerts('{}.csv'.format(os.path.join(input_file)), input_file)['rows']
+
+def read_source_chunks(source, chunk_size=ingest_chunk_size):
+    '''
+    Takes in an alerts source file: a csv file, or any vector file readable by geopandas (e.g. DETER shapefile or
+    GeoPackage exports), and yields (dataframe, geometries) chunks of at most chunk_size rows.
+    Geometries are the source ones (e.g. alert polygons) in WGS84, or None for csv files. LAT/LONG columns missing
+    from vector files are filled with a point inside each geometry.
+    '''
+    if source.lower().endswith('.csv'):
+        for df in pd.read_csv(source, header=0, chunksize=chunk_size):
+            yield df, None
+        return
+    import geopandas as gpd
+    start = 0
+    while True:
+        gdf = gpd.read_file(source, rows=slice(start, start + chunk_size))
+        if gdf.empty:
+            return
+        start += len(gdf)
+        # DETER exports are in SIRGAS 2000
+        if gdf.crs is not None and not gdf.crs.equals('epsg:4326'):
+            gdf = gdf.to_crs('epsg:4326')
+        geometries = gdf.geometry.values
+        df = pd.DataFrame(gdf.drop(columns=gdf.geometry.name))
+        if LONG not in df.columns or LAT not in df.columns:
+            points = shapely.point_on_surface(geometries)
+            # missing or empty geometries get missing coordinates
+            points[shapely.is_empty(points)] = None
+            df[LONG] = shapely.get_x(points)
+            df[LAT] = shapely.get_y(points)
+        yield df, geometries
+
+def polygon_aois(geometries):
+    '''
+    Takes in source alert geometries, and returns an array of AOIs (shapely polygons): their exterior, holes being
+    dropped, or their convex hull for multipolygons. Invalid polygons (e.g. self-intersecting) are made valid first.
+    AOIs are None where geometries are missing, empty, not polygonal or of zero area (see build_geodataframe).
+    '''
+    geometries = shapely.force_2d(np.asarray(geometries, dtype=object))
+    types = shapely.get_type_id(geometries)
+    aois = np.full(len(geometries), None, dtype=object)
+    polygonal = np.isin(types, [shapely.GeometryType.POLYGON, shapely.GeometryType.MULTIPOLYGON])
+    # a self-intersecting polygon becomes a multipolygon (or a collection with lines), of parts of non zero area
+    geometries = shapely.make_valid(np.where(polygonal, geometries, None))
+    types = shapely.get_type_id(geometries)
+    polygons = (types == shapely.GeometryType.POLYGON) & ~shapely.is_empty(geometries)
+    aois[polygons] = shapely.polygons(shapely.get_exterior_ring(geometries[polygons]))
+    collections = np.isin(types, [shapely.GeometryType.MULTIPOLYGON, shapely.GeometryType.GEOMETRYCOLLECTION]) & ~shapely.is_empty(geometries)
+    aois[collections] = shapely.convex_hull(geometries[collections])
+    # hulls of degenerate parts may be lines or points (of zero area), these rows get a point buffer instead
+    aois[~(shapely.area(aois) > 0)] = None
+    return aois
+
+def select_rows(df, seen_ids=None):
+    '''
+    Takes in a dataframe read from an alerts source and a sorted array of hashes of ids already kept (e.g. in previous
+    chunks), and returns (keep, located, seen_ids): boolean masks of rows to keep and of located rows, and seen_ids
+    updated with kept ones. Rows without location are dropped, then only the first row of each id is kept.
+    '''
+    seen_ids = np.array([], dtype=np.uint64) if seen_ids is None else seen_ids
+    # rows without coordinates (nor geometry) can't be located
+    located = df[LONG].notnull().values & df[LAT].notnull().values
+    id_hashes = pd.util.hash_array(df[ID].values)
+    keep = located & ~np.isin(id_hashes, seen_ids)
+    keep[keep] = ~pd.Series(id_hashes[keep]).duplicated().values
+    return keep, located, np.union1d(seen_ids, id_hashes[keep])
+
+def ingest_alerts(source, output_file=database_file_base_name, chunk_size=ingest_chunk_size):
+    '''
+    Takes in an alerts source file (see read_source_chunks) and base filename, and builds the database store
+    (output_file.arrow) chunk_size rows at a time: each chunk is read, filtered (see select_rows), built
+    and written before the next one is read, so that memory used depends on chunk size rather than number of rows
+    (only a hash of each id is kept across chunks). Source polygons are used as AOIs, rows without one getting a
+    point buffer, and rows without location being dropped. Returns a dict of ingest stats.
+    '''
+    build_start_time = time.perf_counter()
+    stats = {'source': source, 'chunks': 0, 'rows_read': 0, 'rows_without_location': 0, 'duplicate_rows': 0, 'rows': 0, 'polygon_aois': 0}
+    seen_ids = np.array([], dtype=np.uint64)
+    with StoreWriter('{}.arrow'.format(os.path.join(output_file))) as writer:
+        chunks = read_source_chunks(source, chunk_size)
+        while True:
+            start_time = time.perf_counter()
+            (df, geometries) = next(chunks, (None, None))
+            if df is None:
+                break
+            stats['chunks'] += 1
+            app.logger.info('1 - Loaded chunk {} of {} ({} rows)'.format(stats['chunks'], source, len(df)))
+            missing_columns = [column for column in (ID, REFERENCE_DATE) if column not in df.columns]
+            if missing_columns:
+                raise ValueError('Columns {} not found in {}'.format(missing_columns, source))
+            (keep, located, seen_ids) = select_rows(df, seen_ids)
+            stats['rows_read'] += len(df)
+            stats['rows_without_location'] += int((~located).sum())
+            stats['duplicate_rows'] += int((located & ~keep).sum())
+            if not keep.any():
+                continue
+            df = df[keep].reset_index(drop=True)
+            aois = polygon_aois(geometries[keep]) if geometries is not None else None
+            row_hashes = hash_rows(df)
+            log_stage_rate('1', start_time, len(df))
+
+            gdf = build_geodataframe(df, aois)
+            stats['polygon_aois'] += int(pd.notnull(aois).sum()) if aois is not None else 0
+
+            app.logger.info('4 - Writing chunk to Arrow store')
+            start_time = time.perf_counter()
+            writer.write(AlertDatabase.from_geodataframe(gdf, database_build_params, row_hashes))
+            log_stage_rate('4', start_time, len(gdf))
+        stats['rows'] = writer.rows
+
+    app.logger.info('5 - Finished preparing database, app is ready with {} rows ({} duplicate and {} unlocated rows dropped)'.format(
+        stats['rows'], stats['duplicate_rows'], stats['rows_without_location']))
+    log_stage_rate('5', build_start_time, stats['rows'])
+    stats['seconds'] = time.perf_counter() - build_start_time
+    return stats
+
+def hash_rows(df):
+    '''
+    Takes in a dataframe read from csv, and returns a uint64 array of hashes of each row content.
     '''
-    app.logger.info('1 - Loading CSV')
-    df = pd.read_csv('{}.csv'.format(os.path.join(database_file_base_name)), header=0)
+    return pd.util.hash_pandas_object(df, index=False).values
 
+def build_geodataframe(df, aois=None):
+    '''
+    Takes in a dataframe read from csv, and returns a geodataframe with dates, UNIX_TIMES, geometry and wkt columns.
+    Geometries are point buffers, or the given aois (e.g. alert polygons, see polygon_aois) where not None.
+    '''
     app.logger.info('2 - Building dates columns')
+    start_time = time.perf_counter()
     # Dates columns
-    df[REFERENCE_DATE] = df[REFERENCE_DATE].apply(lambda row: datetime.datetime.strptime(row, REFERENCE_DATE_FORMAT))
+    df[REFERENCE_DATE] = pd.to_datetime(df[REFERENCE_DATE], format=REFERENCE_DATE_FORMAT)
     # inserting the UNIX_TIMES (X days prior, y days after) into the dataframe after the REFERENCE_DATE column
-    df.insert(4, 'UNIX_TIMES', df.apply(lambda row: create_times(row[REFERENCE_DATE]), axis=1))
+    df.insert(min(4, len(df.columns)), 'UNIX_TIMES', create_times_array(df[REFERENCE_DATE]))
+    log_stage_rate('2', start_time, len(df))
 
     app.logger.info('3a - Building Wkt column - Point geom')
-    geometry = [Point(xy) for xy in zip(df[LONG], df[LAT])]
-    gdf = gpd.GeoDataFrame(df, geometry=geometry)
-    gdf.crs = 'epsg:4326'
+    start_time = time.perf_counter()
+    import geopandas as gpd
+    gdf = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df[LONG], df[LAT]), crs='epsg:4326')
+    log_stage_rate('3a', start_time, len(gdf))
 
     app.logger.info('3b - Building Wkt column - Buffered geom')
-    gdf = gdf.apply(create_buffer, shape=aoi_shape, axis=1)
-    gdf.crs = 'epsg:4326'
+    start_time = time.perf_counter()
+    gdf['geometry'] = create_buffers(gdf, shape=aoi_shape)
+    if aois is not None:
+        has_aoi = pd.notnull(aois)
+        gdf.loc[has_aoi, 'geometry'] = aois[has_aoi]
+    log_stage_rate('3b', start_time, len(gdf))
 
     app.logger.info('3c - Building Wkt column - geom to wkt conversion')
-    gdf['wkt'] = gdf.apply(lambda row: row.geometry.simplify(simplification_threshold).wkt, axis=1)
+    start_time = time.perf_counter()
+    gdf['wkt'] = gdf.geometry.simplify(simplification_threshold).to_wkt(rounding_precision=-1)
+    log_stage_rate('3c', start_time, len(gdf))
+    return gdf
 
-    app.logger.info('4 - Saving prebuilt database to pickle')
-    gdf.to_pickle('{}.pkl'.format(os.path.join(database_file_base_name)))
+def rebuild_database(database, input_file=database_file_base_name, status=None):
+    '''
+    Takes in current AlertDatabase and base filename, and returns a new AlertDatabase built from the csv file,
+    reusing rows of database whose csv content didn't change (matched by row hash) and only building the others.
+    Progress is reported in status dict if provided. Runs under the store build lock, so that worker processes
+    requested to rebuild at once do it one after the other (other workers then reopen the store, see
+    reload_replaced_store).
+    '''
+    status = {} if status is None else status
+    status['stage'] = 'waiting for other builds'
+    with store_build_lock(input_file):
+        return rebuild_changed_rows(database, input_file, status)
 
-    app.logger.info('5 - Finished preparing database, app is ready with {} rows'.format(len(gdf)))
-    return gdf
+def rebuild_changed_rows(database, input_file, status):
+    '''
+    Rebuilds store of rebuild_database, once holding the store build lock.
+    '''
+    store_file = '{}.arrow'.format(os.path.join(input_file))
+
+    status['stage'] = 'loading csv'
+    df = pd.read_csv('{}.csv'.format(os.path.join(input_file)), header=0)
+    # same rows as ingest_alerts: located ones, first row of each id
+    (keep, _, _) = select_rows(df)
+    df = df[keep].reset_index(drop=True)
+    row_hashes = hash_rows(df)
+    status['rows'] = len(df)
+
+    csv_columns = [column for column in database.columns if column not in ('UNIX_TIMES', 'geometry', 'wkt')]
+    if not database.has_row_hashes or list(df.columns) != csv_columns:
+        app.logger.info('Database has no row hashes or csv columns changed, rebuilding all rows')
+        status['stage'] = 'building all rows'
+        status['rows_changed'] = len(df)
+        status['rows_removed'] = len(database)
+        load_csv(input_file)
+        return AlertDatabase.open(store_file, database_build_params)
+
+    # match csv rows with existing rows by content hash, -1 meaning new or changed row
+    status['stage'] = 'matching rows'
+    old_hashes = pd.Index(database.column('ROW_HASH'))
+    first_rows = ~old_hashes.duplicated()
+    old_positions = np.flatnonzero(first_rows)
+    matches = old_hashes[first_rows].get_indexer(row_hashes)
+    changed = matches == -1
+    reused_positions = old_positions[matches[~changed]]
+    status['rows_changed'] = int(changed.sum())
+    status['rows_removed'] = len(database) - len(np.unique(reused_positions))
+    app.logger.info('Rebuilding database: {} rows changed, {} rows removed'.format(status['rows_changed'], status['rows_removed']))
+
+    status['stage'] = 'building {} changed rows'.format(status['rows_changed'])
+    tables = [database.table.take(pa.array(reused_positions, type=pa.int64()))]
+    if changed.any():
+        gdf = build_geodataframe(df[changed].reset_index(drop=True))
+        changed_table = AlertDatabase.from_geodataframe(gdf, database_build_params, row_hashes[changed]).table
+        tables.append(changed_table.select(database.table.column_names).cast(database.table.schema))
+    # put rows back in csv order
+    order = np.argsort(np.concatenate([np.flatnonzero(~changed), np.flatnonzero(changed)]), kind='stable')
+    table = pa.concat_tables(tables).take(pa.array(order, type=pa.int64()))
+
+    status['stage'] = 'saving'
+    AlertDatabase(table.replace_schema_metadata(database.table.schema.metadata)).save(store_file)
+    return AlertDatabase.open(store_file, database_build_params)
+
+def build_id_index(database):
+    '''
+    Takes in an AlertDatabase, and returns an IdIndex mapping each ID to the position of its first row.
+    Used to resolve requested ids without scanning the whole database.
+    '''
+    return IdIndex(database.column(ID))
+
+def set_database(database):
+    '''
+    Makes database the one used by request handlers, along with its id index and (lazily built) spatio-temporal index.
+    All are published at once as a new snapshot, so that requests never see a database with another one's index.
+    '''
+    global db_snapshot
+    alert_index = AlertIndex(database, REFERENCE_DATE)
+    if preload_indexes:
+        alert_index.build()
+    db_snapshot = DatabaseSnapshot(database, build_id_index(database), alert_index)
+
+def reload_replaced_store():
+    '''
+    Reopens the store file of the current database if it was replaced since it was opened (e.g. rebuilt by another
+    worker process of a multi-process server), checking at most every STORE_CHECK_INTERVAL seconds.
+    Requests being served meanwhile keep using the previous snapshot, whose memory-mapped file stays readable.
+    '''
+    now = time.monotonic()
+    if now - store_check['checked_at'] < store_check_interval or not store_reload_lock.acquire(blocking=False):
+        return
+    try:
+        store_check['checked_at'] = now
+        database = db_snapshot.database
+        if database.path is None or file_id(database.path) == database.file_id:
+            return
+        set_database(AlertDatabase.open(database.path, database_build_params))
+        app.logger.info('Store {} was replaced, reopened it with {} rows'.format(database.path, len(db_snapshot.database)))
+    except Exception as e:
+        app.logger.warning('Unable to reopen replaced store {}: {}'.format(database.path, e))
+    finally:
+        store_reload_lock.release()
+
+def get_row(uid):
+    '''
+    Returns the first database row matching uid, raises KeyError if not found.
+    '''
+    snapshot = db_snapshot
+    return snapshot.database.row(snapshot.id_index[uid])
+
+def get_row_positions(uids):
+    '''
+    Bulk version of get_row: returns a (database, positions of first rows of ids found, list of ids not found)
+    tuple, positions being the ones of that database (e.g. for alert_records).
+    '''
+    snapshot = db_snapshot
+    positions = snapshot.id_index.get_positions(uids)
+    found = positions >= 0
+    missing_ids = [uid for (uid, is_found) in zip(uids, found) if not is_found]
+    return snapshot.database, positions[found], missing_ids
+
+def load_precomputed_urls(input_file):
+    '''
+    Takes in a precompute_urls.py output file (CSV or Parquet), and returns PrecomputedUrls (an IdIndex and an
+    Arrow array of Planet Explorer URLs) of rows having one. Returns empty PrecomputedUrls if input_file is not
+    set or can't be read.
+    '''
+    empty = PrecomputedUrls(IdIndex([]), pa.array([], type=pa.string()))
+    if not input_file:
+        return empty
+    try:
+        if input_file.endswith('.parquet'):
+            df = pd.read_parquet(input_file, columns=[ID, 'base_url'])
+        else:
+            df = pd.read_csv(input_file, usecols=[ID, 'base_url'])
+    except Exception as e:
+        app.logger.warning('Unable to read precomputed URLs from {}: {}'.format(input_file, e))
+        return empty
+    df = df.dropna(subset=['base_url'])
+    app.logger.info('Loaded {} precomputed URLs from {}'.format(len(df), input_file))
+    # kept as arrays rather than a dict of Python strings, like the id index
+    return PrecomputedUrls(IdIndex(df[ID].values), pa.array(df['base_url'].values, type=pa.string()))
+
+def get_precomputed_url(uid):
+    '''
+    Returns precomputed Planet Explorer URL of uid, or None if not available.
+    '''
+    position = precomputed_urls.id_index.get(uid)
+    return precomputed_urls.urls[position].as_py() if position is not None else None
+
+def parse_query_area(args):
+    '''
+    Takes in request args, and returns the area of a /api/v1/alerts query as a shapely geometry
+    (from bbox or geometry params), or None if not provided. Raises ValueError on invalid values.
+    '''
+    if 'bbox' in args:
+        bounds = [float(value) for value in args['bbox'].split(',')]
+        if len(bounds) != 4:
+            raise ValueError('bbox must be min long,min lat,max long,max lat')
+        return shapely.box(*bounds)
+    if 'geometry' in args:
+        geometry = args['geometry'].strip()
+        try:
+            return shape(json.loads(geometry)) if geometry.startswith('{') else shapely.from_wkt(geometry)
+        except (shapely.errors.ShapelyError, KeyError, TypeError, AttributeError) as e:
+            raise ValueError('Invalid geometry: {}'.format(e))
+    return None
+
+def alert_records(database, positions, notice_url_prefix, chunk_size=1000):
+    '''
+    Generator over rows at positions as dicts (without decoding geometries), along with their notice URL
+    and precomputed Planet Explorer URL if available. Rows are read chunk_size at a time.
+    '''
+    columns = [ID, LAT, LONG, REFERENCE_DATE, 'UNIX_TIMES_ISO_BEFORE', 'UNIX_TIMES_ISO_AFTER']
+    for start in range(0, len(positions), chunk_size):
+        chunk = pa.array(positions[start:start + chunk_size], type=pa.int64())
+        for values in database.table.take(chunk).select(columns).to_pylist():
+            yield {
+                'id': values[ID],
+                'lat': values[LAT],
+                'long': values[LONG],
+                'reference_date': values[REFERENCE_DATE].isoformat(),
+                'before_date': values['UNIX_TIMES_ISO_BEFORE'],
+                'after_date': values['UNIX_TIMES_ISO_AFTER'],
+                'notice_url': '{}{}'.format(notice_url_prefix, values[ID]),
+                'explorer_url': get_precomputed_url(values[ID]),
+            }
+
+def stream_feature_collection(records, number_matched, number_returned, next_cursor):
+    '''
+    Generator over chunks of a GeoJSON FeatureCollection of records (as Point features), with paging members.
+    '''
+    yield '{"type": "FeatureCollection", "features": [\n'
+    for (i, record) in enumerate(records):
+        feature = {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [record['long'], record['lat']]},
+                   'properties': record}
+        yield '{}{}'.format(',\n' if i else '', json.dumps(feature))
+    yield '\n], "numberMatched": {}, "numberReturned": {}, "next_cursor": {}}}\n'.format(
+        number_matched, number_returned, json.dumps(next_cursor))
+
+def run_rebuild(input_file=database_file_base_name):
+    '''
+    Rebuilds database from csv file (see rebuild_database), then publishes it. Run in a background thread by /rebuild.
+    '''
+    rebuild_status.update({'state': 'running', 'stage': None, 'started_at': datetime.datetime.utcnow().isoformat()+'Z',
+                           'duration': None, 'rows': None, 'rows_changed': None, 'rows_removed': None, 'error': None})
+    start_time = time.perf_counter()
+    try:
+        database = rebuild_database(db_snapshot.database, input_file, status=rebuild_status)
+        set_database(database)
+        rebuild_status.update({'state': 'done', 'stage': None})
+        app.logger.info('Database rebuilt with {} rows'.format(len(database)))
+    except Exception as e:
+        app.logger.exception('Database rebuild failed')
+        rebuild_status.update({'state': 'failed', 'error': str(e)})
+    finally:
+        rebuild_status['duration'] = time.perf_counter() - start_time
+        rebuild_lock.release()
+
+def warm_up():
+    '''
+    Loads precomputed URLs and the database (building its store from csv if needed), publishes them, then marks the
+    app ready. Run in a background thread at start if WARMUP_IN_BACKGROUND is True, requests needing the database
+    being answered with a "warming up" response meanwhile.
+    '''
+    global precomputed_urls
+    warmup_status['state'] = 'running'
+    start_time = time.perf_counter()
+    try:
+        precomputed_urls = load_precomputed_urls(precomputed_urls_file)
+        set_database(load_database())
+        database_ready.set()
+        warmup_status['state'] = 'ready'
+        app.logger.info('Warm-up done in {:.3f}s, app is ready'.format(time.perf_counter() - start_time))
+    except Exception as e:
+        app.logger.exception('Warm-up failed')
+        warmup_status.update({'state': 'failed', 'error': str(e)})
+        if not warmup_in_background:
+            raise
+    finally:
+        warmup_status['duration'] = time.perf_counter() - start_time
+        warmup_done.set()
+
+def wait_until_ready(timeout=None):
+    '''
+    Blocks until warm-up is done (e.g. in scripts using the database right after importing the app), and returns
+    whether the database is ready.
+    '''
+    warmup_done.wait(timeout)
+    return database_ready.is_set()
 
 # Flask request handling functions
 
@@ -317,6 +1220,7 @@ def dotenv_set():
         if 'PL_API_KEY' in request.args:
             try:
                 PLANET_API_KEY = request.args['PL_API_KEY']
+                planet_client.set_api_key(PLANET_API_KEY)
                 status = set_key(find_dotenv(), 'PL_API_KEY', PLANET_API_KEY)
                 app.logger.info('A new Planet API key has been set')
                 return(html_base.format('<p>A new Planet API key has been set<p>'))
@@ -328,13 +1232,138 @@ def dotenv_set():
 
 @app.route('/rebuild', methods=['GET'])
 def db_rebuild():
-    global db_gdf
-    db_gdf = load_database(force_csv=True)
+    if not rebuild_lock.acquire(blocking=False):
+        return html_base.format('''
+    <h1>Planet Hack 2020</h1>
+    <p>Database rebuild already in progress, see <a href="/rebuild/status">/rebuild/status</a></p>
+    ''')
+    # lock is released by run_rebuild once done
+    threading.Thread(target=run_rebuild, name='rebuild', daemon=True).start()
     return html_base.format('''
     <h1>Planet Hack 2020</h1>
-    <p>Pickled database rebuilt from CSV</p>
+    <p>Database rebuild from CSV started, see <a href="/rebuild/status">/rebuild/status</a></p>
     ''')
 
+@app.route('/rebuild/status', methods=['GET'])
+def db_rebuild_status():
+    return flask.jsonify(dict(rebuild_status, database_rows=len(db_snapshot.database) if db_snapshot else None))
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    if search_cache is None:
+        return flask.jsonify({'enabled': False})
+    return flask.jsonify(dict(search_cache.stats(), enabled=True))
+
+@app.route('/catalog/stats', methods=['GET'])
+def catalog_stats():
+    if scene_catalog is None:
+        return flask.jsonify({'enabled': False})
+    return flask.jsonify(dict(scene_catalog.stats(), enabled=True))
+
+@app.route('/redirects/stats', methods=['GET'])
+def redirects_stats():
+    if redirect_table is None:
+        return flask.jsonify({'enabled': False})
+    return flask.jsonify(dict(redirect_table.stats(), enabled=True, refreshing=len(redirect_refreshing)))
+
+@app.route('/cache/invalidate', methods=['GET'])
+def cache_invalidate():
+    if search_cache is None:
+        return html_base.format("<p>Error: SEARCH_CACHE_ENABLED is currently set to False.</p>")
+    removed = search_cache.invalidate()
+    app.logger.info('Search cache invalidated, {} entries removed'.format(removed))
+    return html_base.format('''
+    <h1>Planet Hack 2020</h1>
+    <p>Search cache invalidated ({} entries removed)</p>
+    '''.format(removed))
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    if metrics_enabled == False:
+        return html_base.format("<p>Error: METRICS_ENABLED is currently set to False.</p>")
+    return flask.Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/health/live', methods=['GET'])
+def health_live():
+    '''
+    Liveness probe: answers as soon as the app is started, fails only if warm-up failed (restart needed).
+    '''
+    alive = warmup_status['state'] != 'failed'
+    return flask.jsonify({'alive': alive, 'warmup': warmup_status}), 200 if alive else 503
+
+@app.route('/health/ready', methods=['GET'])
+def health_ready():
+    '''
+    Readiness probe: fails until the database is loaded.
+    '''
+    ready = database_ready.is_set()
+    return flask.jsonify({'ready': ready, 'warmup': warmup_status}), 200 if ready else 503
+
+# endpoints needing the database, answered with a "warming up" response until it's loaded
+database_endpoints = {'api_id', 'api_ids', 'api_alerts', 'db_rebuild'}
+
+@app.before_request
+def check_warmed_up():
+    '''
+    Answers requests needing the database with a fast 503 "warming up" response (with a Retry-After header)
+    until warm-up is done. /api/v1/notice pages, opened in browsers, reload themselves after Retry-After seconds.
+    '''
+    if database_ready.is_set() or request.endpoint not in database_endpoints:
+        return None
+    headers = {'Retry-After': str(warmup_retry_after)}
+    if request.endpoint == 'api_id':
+        notice_requests.inc(outcome='warming_up')
+        return html_base.format('''
+    <head><meta http-equiv="refresh" content="{}" /></head>
+    <p>Warming up, this page will reload in a few seconds.</p>
+    '''.format(warmup_retry_after)), 503, headers
+    return flask.jsonify({'error': 'warming up', 'warmup': warmup_status}), 503, headers
+
+@app.before_request
+def check_store_replaced():
+    '''
+    Serves requests needing the database from its latest store file, e.g. once rebuilt by another worker process.
+    '''
+    if db_snapshot is not None and request.endpoint in database_endpoints:
+        reload_replaced_store()
+
+@app.before_request
+def start_profiling():
+    '''
+    Starts profiling requests having a profile=1 param, when PROFILING_ENABLED is True.
+    '''
+    if profiling_enabled and request.args.get('profile') == '1':
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # another request is already being profiled
+            app.logger.warning('Unable to profile request: {}'.format(e))
+        else:
+            flask.g.profiler = profiler
+
+@app.after_request
+def stop_profiling(response):
+    '''
+    Stops profiling started by start_profiling, logs top functions by cumulative time and saves
+    full stats to PROFILING_DIR (e.g. for snakeviz), returning the file name in X-Profile-File header.
+    '''
+    profiler = flask.g.pop('profiler', None)
+    if profiler is None:
+        return response
+    profiler.disable()
+    os.makedirs(profiling_dir, exist_ok=True)
+    profile_file = os.path.join(profiling_dir, '{}_{}.prof'.format(
+        datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S%f'), request.endpoint))
+    profiler.dump_stats(profile_file)
+    import pstats
+    stats_output = io.StringIO()
+    pstats.Stats(profiler, stream=stats_output).sort_stats('cumulative').print_stats(25)
+    app.logger.info('Profile of {} saved to {}\n{}'.format(request.full_path, profile_file, stats_output.getvalue()))
+    response.headers['X-Profile-File'] = profile_file
+    return response
+
 @app.route('/api/v1/notice', methods=['GET'])
 def api_id():
     '''
@@ -342,8 +1371,9 @@ def api_id():
     mandatory params:
     - id: unique id of a row (int)
     optional params:
-    - rm: Radius in Meters around the coordinates to create circle or share shape (int)
-    - sh: 'ci' or 'sq': 'circle' or 'square' shape centered on point (string)
+    - rm: Radius in Meters around the coordinates to create circle or share shape (int), used instead of the alert
+      polygon if any
+    - sh: 'ci' or 'sq': 'circle' or 'square' shape centered on point (string), used instead of the alert polygon if any
     - db: number of Days Before date in database for beginning of image search period (int)
     - da: number of Days After date in database for end of image search period (int)
     - cc: max cloud cover accepted (int, 0 to 100)
@@ -352,11 +1382,13 @@ def api_id():
     # Check if an ID was provided as part of the URL.
     # If ID is provided and exists, redirect to Planet Explorer
     # If no ID is provided, display an error in the browser.
+    request_start_time = time.perf_counter()
     if 'id' in request.args:
         uid = int(request.args['id'])
         app.logger.info('Incoming request with id {}'.format(uid))
     else:
         app.logger.warning('Incoming request with no id param')
+        notice_requests.inc(outcome='missing_id')
         return html_base.format("<p>Error: No id field provided. Please specify an id.<p>")
 
     # handle radius optional parameter
@@ -393,27 +1425,35 @@ def api_id():
     else:
         custom_cloud_cover = default_cloud_cover
 
+    custom_parameters = (custom_radius, custom_shape, custom_days_before_date, custom_days_after_date, custom_cloud_cover)
+    default_parameters = (radius, aoi_shape, days_before_date, days_after_date, default_cloud_cover)
+
     # search for row with provided id
     try:
         # take first row matching id
-        row = db_gdf[db_gdf[ID]==uid].iloc[0]
+        with notice_stage_duration.time(stage='id_lookup'):
+            row = get_row(uid)
         # temporarily update row geometry with new radius if provided
         if (custom_radius != radius) or (custom_shape != aoi_shape):
-            custom_radius_in_deg = custom_radius/float(one_degree_lat_as_meters(lat=row[LAT]))
-            if custom_shape == 'circle': 
-                row['geometry'] = Point(row[LONG], row[LAT]).buffer(custom_radius_in_deg)
-            elif custom_shape == 'square':
-                row['geometry'] = Point(row[LONG], row[LAT]).buffer(custom_radius_in_deg).envelope
-            else:
-                logging.warning('Invalid {} shape value'.format(shape))
-                row["geometry"] = None
-            row['wkt'] = row['geometry'].simplify(simplification_threshold).wkt.replace(' ','')
+            with notice_stage_duration.time(stage='custom_aoi'):
+                row['geometry'], row['wkt'] = get_custom_aoi(row[LONG], row[LAT], custom_radius, custom_shape)
+            aoi_description = 'Radius = {} m, shape = {}'.format(custom_radius, custom_shape)
+        elif has_polygon_aoi(row):
+            aoi_description = 'AOI = alert polygon'
+        else:
+            aoi_description = 'Radius = {} m, shape = {}'.format(radius, aoi_shape)
         if (custom_days_before_date != days_before_date) or (custom_days_after_date != days_after_date):
             row['UNIX_TIMES'] = create_times(row[REFERENCE_DATE], custom_days_before_date, custom_days_after_date)
-        # compute redirect URL from default and updated parameters
-        base_url = compute_url(row, max_cloud_cover=custom_cloud_cover)
+        # default parameters URLs are served from the redirect table, custom ones are computed
+        if redirect_table and custom_parameters == default_parameters:
+            with notice_stage_duration.time(stage='redirect_table'):
+                base_url = get_default_url(uid, row)
+        else:
+            base_url = compute_url(row, max_cloud_cover=custom_cloud_cover)
     except Exception as e:
         app.logger.warning(e)
+        notice_requests.inc(outcome='error')
+        notice_stage_duration.observe(time.perf_counter() - request_start_time, stage='total')
         return html_base.format("<p>Error: Non existing id or unexpected error.</p>")
  
     if base_url:
@@ -429,7 +1469,7 @@ def api_id():
                 <p>Redirecting to Planet Explorer site with the following settings:</p>
                 <ul>
                 <li>Map centered on (Lat, Lng) = ({}, {})</li>
-                <li>Radius = {} m, shape = {}</li>
+                <li>{}</li>
                 <li>Max cloud cover = {}%</li>
                 <li>Min footprint intersection with AOI = {}%</li>
                 <li>Reference date: {}</li>
@@ -438,7 +1478,7 @@ def api_id():
                 </ul>
             </body>
             </html>
-        """.format(redirect_delay, base_url, row[LAT], row[LONG], custom_radius, custom_shape, 
+        """.format(redirect_delay, base_url, row[LAT], row[LONG], aoi_description,
                 custom_cloud_cover, intersection_filter, row[REFERENCE_DATE], 
                 row['UNIX_TIMES'][2], custom_days_before_date, 
                 row['UNIX_TIMES'][3], custom_days_after_date)
@@ -451,15 +1491,103 @@ def api_id():
             </body>
             </html>
         """       
+    notice_requests.inc(outcome='redirect' if base_url else 'no_scene')
+    notice_stage_duration.observe(time.perf_counter() - request_start_time, stage='total')
     return (page_content)
 
+@app.route('/api/v1/notices', methods=['GET'])
+def api_ids():
+    '''
+    route resolving many ids in one call (e.g. to prefetch a page of alerts), rows are read without decoding
+    geometries (see alert_records)
+    mandatory params:
+    - ids: comma separated unique ids of rows (int), up to NOTICES_MAX_IDS
+    '''
+    if 'ids' in request.args:
+        try:
+            uids = [int(uid) for uid in request.args['ids'].split(',') if uid.strip()]
+        except ValueError as e:
+            app.logger.warning(e)
+            return flask.jsonify({'error': 'ids must be comma separated integers'}), 400
+        app.logger.info('Incoming bulk request with {} ids'.format(len(uids)))
+        if len(uids) > notices_max_ids:
+            return flask.jsonify({'error': 'At most {} ids per request'.format(notices_max_ids)}), 400
+    else:
+        app.logger.warning('Incoming bulk request with no ids param')
+        return flask.jsonify({'error': 'No ids field provided. Please specify ids.'}), 400
+
+    (database, positions, missing_ids) = get_row_positions(uids)
+    notices = list(alert_records(database, positions, flask.url_for('api_id', _external=True) + '?id='))
+    return flask.jsonify({'notices': notices, 'missing_ids': missing_ids})
+
+@app.route('/api/v1/alerts', methods=['GET'])
+def api_alerts():
+    '''
+    route querying alerts by area and/or reference date range (using spatial and date indexes), results are
+    ordered by reference date and streamed as JSON lines (default) or GeoJSON
+    optional params:
+    - bbox: min long, min lat, max long, max lat of area (comma separated floats)
+    - geometry: area as a GeoJSON geometry or WKT, e.g. a municipality polygon (string)
+    - start: first reference date, inclusive (YYYY-MM-DD)
+    - end: last reference date, inclusive (YYYY-MM-DD)
+    - format: 'jsonl' or 'geojson' (string)
+    - limit: max number of alerts returned (int)
+    - cursor: position in results to start from, as returned in X-Next-Cursor header (int)
+    '''
+    try:
+        area = parse_query_area(request.args)
+        start = np.datetime64(request.args['start']) if 'start' in request.args else None
+        end = np.datetime64(request.args['end']) if 'end' in request.args else None
+        limit = min(int(request.args.get('limit', alerts_query_default_limit)), alerts_query_max_limit)
+        cursor = int(request.args.get('cursor', 0))
+        output_format = request.args.get('format', 'jsonl')
+        if limit < 1 or cursor < 0 or output_format not in ('jsonl', 'geojson'):
+            raise ValueError('limit must be positive, cursor must not be negative, format must be jsonl or geojson')
+    except ValueError as e:
+        app.logger.warning(e)
+        return flask.jsonify({'error': str(e)}), 400
+
+    snapshot = db_snapshot
+    with alerts_query_duration.time():
+        positions = snapshot.alert_index.query(area, start, end)
+    page = positions[cursor:cursor + limit]
+    next_cursor = cursor + len(page) if cursor + len(page) < len(positions) else None
+    app.logger.info('Alerts query matched {} alerts, returning {}'.format(len(positions), len(page)))
+
+    headers = {'X-Total-Count': str(len(positions))}
+    if next_cursor is not None:
+        headers['X-Next-Cursor'] = str(next_cursor)
+        headers['Link'] = '<{}>; rel="next"'.format(
+            flask.url_for('api_alerts', _external=True, **dict(request.args.to_dict(), cursor=next_cursor)))
+    records = alert_records(snapshot.database, page, flask.url_for('api_id', _external=True) + '?id=')
+    if output_format == 'geojson':
+        body = stream_feature_collection(records, len(positions), len(page), next_cursor)
+        mimetype = 'application/geo+json'
+    else:
+        body = ('{}\n'.format(json.dumps(record)) for record in records)
+        mimetype = 'application/x-ndjson'
+    return flask.Response(flask.stream_with_context(body), mimetype=mimetype, headers=headers)
+
 ##################
 #                #
 #      Main      #
 #                #
 ##################
 
-db_gdf = load_database()
+def reopen_after_fork():
+    '''
+    Reopens SQLite connections in worker processes forked after the app was loaded (e.g. gunicorn --preload).
+    The database store and indexes need nothing: their memory is shared with the parent, read-only.
+    '''
+    for store in (search_cache, scene_catalog, redirect_table):
+        if store:
+            store.reconnect()
+
+os.register_at_fork(after_in_child=reopen_after_fork)
+if warmup_in_background:
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+else:
+    warm_up()
 
 if __name__ == '__main__':
 